@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+# This script measures the speed and memory use of every step of the pipeline, without the real
+# corpora. It generates a synthetic corpus in the same formats (gzipped Europarl-style XML, Books-style
+# XML and tagged .pos files), runs the scripts on it, and records the wall time, the throughput and the
+# peak memory use of every step. The results can be stored as a baseline, and later runs are compared
+# to it, so performance regressions show up without a multi-hour run on the real data.
+# Everything runs offline. Steps that need missing resources (e.g. NLTK's tagger model) are reported
+# as failed, and the other steps still run. The classifier is also evaluated on a tagged test set that
+# only contains some of the languages, which has to work as well.
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+# The languages of the Europarl corpus, and the languages that the classifier is trained on
+EUROPARL_LANGUAGES = ['EN', 'DE', 'FR', 'NL', 'IT', 'ES', 'PL', 'SV', 'DA', 'FI', 'PT', 'EL', 'CS', 'HU']
+LANGUAGES = ['DE', 'EN', 'ES', 'FR', 'IT', 'NL']
+# The languages of the tagged test set
+TEST_LANGUAGES = ['DE', 'FR']
+WORDS = ('the of and to a in is that for it this on we be are not with as by have which Commission '
+         'Parliament report Council Member States European Union President vote proposal must should '
+         'policy debate amendment citizens . , ( ) ? ; : - important support believe also').split()
+TAGS = ('NN NNS NNP IN DT JJ VB VBZ VBD VBN VBG VBP RB PRP PRP$ CC TO MD CD WDT WP POS RP . , : ( ) EX '
+        'JJR JJS RBR').split()
+FIRST_NAMES = 'Andrew Anna Bill Catherine David Elizabeth Gary Glenys Hans Jean Luigi Maria Pierre Sarah'.split()
+LAST_NAMES = 'Duff Kinnock Titley Watson Muller Dupont Rossi Garcia Jansen Smith Evans Jones Taylor Brown'.split()
+
+
+def sentence(rng, length):
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+
+def write_europarl(path, rng, reports, speakers):
+    """
+    Write gzipped Europarl-style reports: every report is available in English, and in a few other
+    languages, and contains speeches (SPEAKER elements with an ID, NAME and LANGUAGE) of varying length.
+    Returns the names of the MEPs from the United Kingdom.
+    """
+    meps = ['{} {}'.format(first, last) for first in FIRST_NAMES[:7] for last in LAST_NAMES[:7]]
+    for report in range(reports):
+        code = 'ep-{:05d}'.format(report)
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<document>', '<CHAPTER ID="1">']
+        for speaker in range(1, speakers + 1):
+            language = rng.choice(EUROPARL_LANGUAGES)
+            if language == 'EN':
+                name = rng.choice(meps) if rng.random() < 0.7 else '{} {}'.format(
+                    rng.choice(FIRST_NAMES[7:]), rng.choice(LAST_NAMES[7:]))
+            else:
+                name = '{} {}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+            # Some speeches have no language tag, like the speeches of the President
+            attributes = ' LANGUAGE="{}"'.format(language) if rng.random() < 0.9 else ''
+            lines.append('<SPEAKER ID="{}" NAME="{}"{}>'.format(speaker, name, attributes))
+            lines.append('<P id="1">')
+            for i in range(rng.randint(2, 120)):
+                lines.append('<s id="{}">{}</s>'.format(i + 1, sentence(rng, rng.randint(5, 35))))
+            lines.append('</P>')
+            lines.append('</SPEAKER>')
+        lines += ['</CHAPTER>', '</document>']
+        content = '\n'.join(lines).encode('utf-8')
+        for language in ['en', 'de', 'fr']:
+            os.makedirs('{}/{}'.format(path, language), exist_ok=True)
+            with gzip.open('{}/{}/{}.xml.gz'.format(path, language, code), 'wb') as file_handle:
+                file_handle.write(content)
+    return meps
+
+
+def write_books(path, rng, books, sentences):
+    """Write gzipped Books-style XML files (raw/en/<book>.xml.gz)"""
+    os.makedirs('{}/raw/en'.format(path), exist_ok=True)
+    for book in range(books):
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<text>', '<head></head>', '<body>']
+        for i in range(sentences):
+            lines.append('<s id="{}">{}</s>'.format(i + 1, sentence(rng, rng.randint(5, 35))))
+        lines += ['</body>', '</text>']
+        with gzip.open('{}/raw/en/Book-{}.xml.gz'.format(path, book), 'wb') as file_handle:
+            file_handle.write('\n'.join(lines).encode('utf-8'))
+
+
+def write_tagged(path, rng, documents, languages=LANGUAGES):
+    """
+    Write tagged .pos documents for every language. The tags of every language are drawn from a
+    slightly different distribution, so the classifier has something to learn.
+    """
+    for language in languages:
+        os.makedirs('{}/{}'.format(path, language), exist_ok=True)
+        weights = [1 + random.Random(language + tag).random() for tag in TAGS]
+        for document in range(documents):
+            lines = [' '.join(rng.choices(TAGS, weights, k=rng.randint(5, 35))) for _ in range(rng.randint(15, 80))]
+            with open('{}/{}/{}.{}.txt.pos'.format(path, language, language, document), 'w') as file_handle:
+                file_handle.write(''.join(line + '\n' for line in lines))
+
+
+def generate(path):
+    """Generate the synthetic corpus, unless it was already generated with the same settings"""
+    settings = {'scale': args.scale, 'seed': args.seed}
+    settings_file = '{}/settings.json'.format(path)
+    if os.path.exists(settings_file) and os.path.isdir('{}/tagged_test'.format(path)):
+        with open(settings_file, 'r') as file_handle:
+            if json.load(file_handle) == settings:
+                print('Using the synthetic corpus in {}'.format(path))
+                return
+    print('Generating a synthetic corpus (scale {})...'.format(args.scale))
+    shutil.rmtree(path, ignore_errors=True)
+    rng = random.Random(args.seed)
+    meps = write_europarl('{}/europarl'.format(path), rng, 20 * args.scale, 25)
+    with open('{}/meps.txt'.format(path), 'w') as file_handle:
+        file_handle.write(''.join(name + '\n' for name in meps))
+    write_books('{}/books'.format(path), rng, 2 * args.scale, 2000)
+    write_tagged('{}/tagged'.format(path), rng, 50 * args.scale)
+    # A test set that only contains some of the languages, like the Books dataset
+    write_tagged('{}/tagged_test'.format(path), rng, 10 * args.scale, TEST_LANGUAGES)
+    with open(settings_file, 'w') as file_handle:
+        json.dump(settings, file_handle)
+
+
+def count(pattern):
+    return len(glob.glob(pattern))
+
+
+def stages(data, run):
+    """
+    Return the steps of the pipeline as (name, command, function that counts the processed items, unit).
+    The items are counted before the step runs.
+    """
+    python = [sys.executable]
+    jobs = ['-j', str(args.jobs)]
+    return [
+        ('find_fragments', python + ['{}/find_fragments.py'.format(SCRIPTS), '{}/europarl'.format(data),
+                                     '{}/meps.txt'.format(data)] + jobs,
+         lambda: count('{}/europarl/*/*.xml.gz'.format(data)), 'files'),
+        ('split_data', python + ['{}/split_data.py'.format(SCRIPTS), '{}/europarl'.format(data),
+                                 '{}/fragment_data'.format(run)] + jobs,
+         lambda: count('{}/europarl/en/*.xml.gz'.format(data)), 'reports'),
+        ('select_files', python + ['{}/select_files.py'.format(SCRIPTS), '{}/fragment_data'.format(run),
+                                   '{}/selected'.format(run)],
+         lambda: count('{}/fragment_data/*/*.txt'.format(run)), 'files'),
+        ('convert_to_pos', python + ['{}/convert_to_pos.py'.format(SCRIPTS), '{}/selected'.format(run)] + jobs,
+         lambda: count('{}/selected/*/*.txt'.format(run)), 'files'),
+        ('book_to_txt', python + ['{}/book_to_txt.py'.format(SCRIPTS), '{}/books'.format(data),
+                                  '{}/books'.format(run)],
+         lambda: count('{}/books/raw/en/*.xml.gz'.format(data)), 'books'),
+        # The first run transforms the documents and fits the classifier, the second run loads
+        # the transformed documents from the cache, so it only fits the classifier
+        ('classify_sk featurize+fit', python + ['{}/classify_sk.py'.format(SCRIPTS), 'train', '--cache',
+                                                '{}/feature_cache'.format(run), '{}/model.npz'.format(run),
+                                                '{}/tagged'.format(data)],
+         lambda: count('{}/tagged/*/*.pos'.format(data)), 'documents'),
+        ('classify_sk fit', python + ['{}/classify_sk.py'.format(SCRIPTS), 'train', '--cache',
+                                      '{}/feature_cache'.format(run), '{}/model.npz'.format(run),
+                                      '{}/tagged'.format(data)],
+         lambda: count('{}/tagged/*/*.pos'.format(data)), 'documents'),
+        ('classify_sk evaluate', python + ['{}/classify_sk.py'.format(SCRIPTS), 'cv', '--cache',
+                                           '{}/feature_cache'.format(run), '--evaluate', '{}/tagged_test'.format(data),
+                                           '{}/tagged'.format(data)],
+         lambda: count('{}/tagged_test/*/*.pos'.format(data)), 'documents'),
+        ('classify_sk predict', python + ['{}/classify_sk.py'.format(SCRIPTS), 'predict', '{}/model.npz'.format(run),
+                                          '{}/tagged'.format(data)],
+         lambda: count('{}/tagged/*/*.pos'.format(data)), 'documents'),
+    ]
+
+
+def run_stage(name, command, cwd):
+    """
+    Run a single step in a new process. Returns whether it succeeded, its wall time in seconds,
+    and the peak resident memory (in MB) of the largest of its processes.
+    """
+    log = '{}/{}.log'.format(cwd, name.replace(' ', '_'))
+    with open(log, 'w') as file_handle:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, stdout=file_handle, stderr=subprocess.STDOUT)
+        # wait4 returns the resource usage of this process (and of its worker processes)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux
+    return process.returncode == 0, seconds, usage.ru_maxrss / 1024
+
+
+def compare(results, baseline):
+    """Print the change of every step compared to the baseline. Returns the names of the slower steps."""
+    if baseline['settings'] != {'scale': args.scale, 'seed': args.seed}:
+        print('Warning: the baseline was measured with different settings ({})'.format(baseline['settings']))
+    slower = []
+    print()
+    print('{:<28}{:>12}{:>12}{:>10}{:>12}{:>12}'.format('step', 'baseline s', 'now s', 'change', 'base MB', 'now MB'))
+    for name, result in results.items():
+        if name not in baseline['stages'] or not result['ok'] or not baseline['stages'][name]['ok']:
+            continue
+        before = baseline['stages'][name]
+        change = result['seconds'] / before['seconds'] - 1
+        print('{:<28}{:>12.2f}{:>12.2f}{:>+10.0%}{:>12.1f}{:>12.1f}'.format(
+            name, before['seconds'], result['seconds'], change, before['peak_rss_mb'], result['peak_rss_mb']))
+        if change > args.tolerance:
+            slower.append(name)
+    return slower
+
+
+def main():
+    data = '{}/data'.format(args.output)
+    run = '{}/run'.format(args.output)
+    generate(data)
+    # Every step starts from scratch, so caches of earlier runs do not influence the results
+    shutil.rmtree(run, ignore_errors=True)
+    os.makedirs('{}/fragment_data'.format(run))
+    results = dict()
+    print()
+    print('{:<28}{:>10}{:>10}{:>16}{:>12}'.format('step', 'items', 'seconds', 'items/second', 'peak MB'))
+    for name, command, items, unit in stages(data, run):
+        if args.stages and name.split()[0] not in args.stages and name not in args.stages:
+            continue
+        n = items()
+        ok, seconds, peak = run_stage(name, command, run)
+        results[name] = {'ok': ok, 'items': n, 'unit': unit, 'seconds': seconds,
+                         'items_per_second': n / seconds, 'peak_rss_mb': peak}
+        if ok:
+            print('{:<28}{:>10}{:>10.2f}{:>16}{:>12.1f}'.format(
+                name, n, seconds, '{:.1f} {}'.format(n / seconds, unit), peak))
+        else:
+            print('{:<28} failed, see {}/{}.log'.format(name, run, name.replace(' ', '_')))
+    report = {'settings': {'scale': args.scale, 'seed': args.seed}, 'stages': results}
+    with open('{}/results.json'.format(args.output), 'w') as file_handle:
+        json.dump(report, file_handle, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file_handle:
+            json.dump(report, file_handle, indent=2)
+        print('Baseline saved to {}'.format(args.save_baseline))
+    if args.baseline:
+        with open(args.baseline, 'r') as file_handle:
+            slower = compare(results, json.load(file_handle))
+        if slower:
+            print('Slower than the baseline (by more than {:.0%}): {}'.format(args.tolerance, ', '.join(slower)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', type=str, default='./benchmark',
+                        help='The location of the synthetic corpus and the results (default: %(default)s)')
+    parser.add_argument('-s', '--scale', type=int, default=1,
+                        help='The size of the synthetic corpus; 1 is 20 reports with 25 speeches each, '
+                             '2 books and 50 tagged documents per language (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic corpus (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='The number of processes the steps may use (default: the number of CPUs)')
+    parser.add_argument('--stages', nargs='+', metavar='STEP',
+                        help='Only run these steps (e.g. find_fragments classify_sk) (default: all steps)')
+    parser.add_argument('-b', '--baseline', type=str, metavar='FILE',
+                        help='Compare the results to a baseline that was saved with --save-baseline')
+    parser.add_argument('--save-baseline', type=str, metavar='FILE', help='Save the results as a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='The relative slowdown at which a step counts as slower than the baseline '
+                             '(default: %(default)s)')
+    args = parser.parse_args()
+    if args.output[-1] == '/':
+        args.output = args.output[:-1]
+    args.output = os.path.abspath(args.output)
+    main()
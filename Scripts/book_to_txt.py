@@ -1,25 +1,107 @@
 #!/usr/bin/env python3
 
 # This script will put the sentences of the English books in the books dataset into text files.
+# The books are streamed (so a book never has to be in memory as a whole), and spread over multiple
+# processes. With a file that lists the source language of every book, the text files are written
+# directly into a folder per language, so they can be used as a test set right away. The books can
+# also be tagged (like convert_to_pos does) and packed (see packed_corpus) in the same pass.
 
 import glob
 import argparse
-import gzip
-import xml.etree.ElementTree as ET
-from collections import defaultdict
 import os
+from multiprocessing import Pool
+from corpus_xml import iter_elements, report_code
+import instrumentation
+
+
+def read_languages(filename):
+    """
+    Read the file that maps books to their source language. Every line contains the name of a book
+    (its filename without '.xml.gz') and a language code, separated by whitespace. Empty lines and
+    lines starting with # are ignored.
+    """
+    languages = dict()
+    with open(filename, 'r') as file_handle:
+        for line in file_handle:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                name, language = line.rsplit(None, 1)
+                languages[name] = language.upper()
+    return languages
+
+
+def load_tagger():
+    """Load the tagger of convert_to_pos once for every worker process (only when the books are tagged)"""
+    global convert_to_pos
+    import convert_to_pos
+    convert_to_pos.load_tagger()
+
+
+def convert_book(job):
+    """
+    Write the sentences of a book to a text file, and optionally create its tagged versions.
+    Returns the path of the text file, and the tagsets for which a tagged version was created.
+    """
+    path, output, tagsets = job
+    lines = []
+    for i, sentence in enumerate(iter_elements(path, 's')):
+        # The first sentence is the title of the book
+        if i == 0:
+            continue
+        lines.append('{}\n'.format(sentence.text))
+    with open(output, 'w') as file_handle:
+        file_handle.write(''.join(lines))
+    if tagsets:
+        for tagset, tagged_lines in convert_to_pos.tag_lines(lines, tagsets).items():
+            convert_to_pos.preprocess_cache.write_output(output + convert_to_pos.EXTENSIONS[tagset],
+                                                         ''.join(line + '\n' for line in tagged_lines))
+    return output, tagsets
 
 
 def main():
-    for path in glob.glob('{}/raw/en/*.xml.gz'.format(args.input)):
-        name = path.split('/')[-1][:-7]
-        with gzip.open(path, 'rb') as file_handle:
-            with open('{}/{}.txt'.format(args.output, name), 'w') as out:
-                tree = ET.fromstring(file_handle.read())
-                for i, sentence in enumerate(tree.findall('.//s')):
-                    if i == 0:
-                        continue
-                    print(sentence.text, file=out)
+    paths = sorted(glob.glob('{}/raw/en/*.xml.gz'.format(args.input)))
+    languages = read_languages(args.languages) if args.languages else dict()
+    jobs = []
+    unknown = 0
+    for path in paths:
+        name = report_code(path)
+        if name in languages:
+            folder = '{}/{}'.format(args.output, languages[name])
+        elif args.languages:
+            unknown += 1
+            if args.skip_unknown:
+                continue
+            folder = args.output
+        else:
+            folder = args.output
+        os.makedirs(folder, exist_ok=True)
+        jobs.append((path, '{}/{}.txt'.format(folder, name), args.tagsets))
+    if unknown:
+        print('{} books are not in {}{}'.format(unknown, args.languages, ', skipping them' if args.skip_unknown
+                                                else ', putting them in {}'.format(args.output)))
+    initializer = load_tagger if args.tagsets else None
+    if args.tagsets:
+        # The tagged versions are recorded in the cache of convert_to_pos, so it does not tag them again
+        # The tagger is loaded here first, so a missing tagger model is reported before the pool starts
+        load_tagger()
+        cache = convert_to_pos.preprocess_cache.connect(args.output)
+    with run.stage('convert', total=len(jobs), unit='books') as stage, Pool(args.jobs, initializer) as pool:
+        for output, tagsets in pool.imap_unordered(convert_book, jobs):
+            if tagsets:
+                digest = convert_to_pos.preprocess_cache.file_hash(output)
+                for tagset in tagsets:
+                    convert_to_pos.preprocess_cache.store(cache, os.path.relpath(output, args.output),
+                                                          convert_to_pos.EXTENSIONS[tagset], digest,
+                                                          convert_to_pos.tagger_identity(tagset))
+            stage.update()
+    if args.tagsets:
+        cache.commit()
+        if args.pack:
+            import packed_corpus
+            for tagset in args.tagsets:
+                for language in sorted(set(languages.values())):
+                    if os.path.isdir('{}/{}'.format(args.output, language)):
+                        packed_corpus.pack(args.output, language, convert_to_pos.EXTENSIONS[tagset])
 
 
 if __name__ == '__main__':
@@ -27,12 +109,31 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('input', type=str, help='The path to the Books dataset')
     parser.add_argument('output', type=str, help='The location where to put the text files')
+    parser.add_argument('-l', '--languages', type=str, metavar='FILE',
+                        help='A file with the source language of every book ("<BOOK> <LANGUAGE>" on every line). '
+                             'The text files are put in a folder for every language.')
+    parser.add_argument('--skip-unknown', action='store_true',
+                        help='Skip the books that are not in the languages file (instead of putting them in OUTPUT)')
+    parser.add_argument('-f', '--features', choices=['POS', 'POS-universal', 'both'],
+                        help='Also create tagged versions of the text files, like convert_to_pos does')
+    parser.add_argument('-p', '--pack', action='store_true',
+                        help='Also store the tagged files of every language in packed form (see packed_corpus)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='The number of processes to use (default: the number of CPUs)')
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
+    run = instrumentation.start('book_to_txt', args)
     # Format path as required
     if args.input[-1] == '/':
         args.input = args.input[:-1]
     if args.output[-1] == '/':
         args.output = args.output[:-1]
+    if args.features == 'both':
+        args.tagsets = ['POS', 'POS-universal']
+    else:
+        args.tagsets = [args.features] if args.features else []
+    if args.pack and not (args.tagsets and args.languages):
+        parser.error('--pack requires --features and --languages')
     # Create output folder if needed
     if not os.path.exists(args.output):
         os.makedirs(args.output)
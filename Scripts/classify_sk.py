@@ -3,165 +3,655 @@
 # This is the script that trains and evaluates my classifier pipeline.
 # There are multiple available features, balancing the dataset can
 # be turned on and off, and the classifier can be evaluated on a different
-# testset as well.
+# testset as well. The classifier can also be trained once and saved (train),
+# and then be used to classify new documents (predict). Corpora that do not fit
+# in memory can be cross-validated with incremental training (stream), and a grid
+# of configurations can be compared in a single run (sweep).
+# scikit-learn, scipy and joblib are only imported by the commands that train a classifier,
+# so classifying documents with a saved classifier (predict) only loads numpy and starts quickly.
 
 import glob
 import numpy
+import os
 import sys
 import warnings
 import argparse
-from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
-from sklearn.metrics import confusion_matrix, classification_report
-from sklearn.model_selection import StratifiedKFold
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import LabelEncoder
-from sklearn.svm import LinearSVC
+from itertools import islice
+import dataset
+import feature_importance
+import instrumentation
+import metrics
+import model_bundle
+import ngram_features
+import packed_corpus
+import sweep as sweep_module
 
+# The sizes of the n-grams that are used for each type of features
+NGRAM_RANGES = {'tokens': (1, 2), 'POS': (2, 5), 'POS-universal': (2, 5)}
+# The number of bits of the hashed n-gram columns, the same as the default of ngram_features
+HASH_BITS = ngram_features.N_FEATURES.bit_length() - 1
+# The sampling method of the balancing settings of the sweep command (see dataset.sample)
+SAMPLING = {'balanced': 'under', 'oversampled': 'over'}
+# The extension of the files with each type of features
+EXTENSIONS = {'tokens': '.txt', 'POS': '.pos', 'POS-universal': '.uni'}
+# The names of the types of features in the score files that the scripts in the R folder read
+R_FEATURES = {'tokens': 'token', 'POS': 'pos'}
 
-def load_data(languages, label_encoder, path, extension, balance=True):
+
+def r_score_file(features, balance):
     """
-    Create an array of filenames which contain samples, and an array of associated labels.
-    if balance is set to True, the dataset will automatically be balanced.
+    Return the name of the score file that the R scripts read for the default configuration of a type
+    of features and a balancing setting (e.g. 'balanced_pos.txt'), or None if they do not read one
     """
-    x = []
-    y = []
-    # If we want to use a balanced dataset, we use the same number of samples for every class.
-    # This number is determined by the number of samples in the class with the least amount of samples.
-    if balance:
-        min_size = min([len(glob.glob('{}/{}/*{}'.format(path, lang, extension))) for lang in languages])
-    else:
-        min_size = None  # Slicing a list with [:None] returns the whole list
-    # Put filenames in x, and the corresponding label in y
-    for lang in languages:
-        filenames = glob.glob('{}/{}/*{}'.format(path, lang, extension))
-        x += filenames[:min_size]
-        y += [lang] * len(filenames[:min_size])
-    return numpy.array(x), label_encoder.transform(y)
-
-
-def get_ngrams(list_of_tags, n=3):
-    """Create a list containing strings which denote n-grams"""
-    return [ascii(tuple(list_of_tags[i:i + n])) for i in range(len(list_of_tags) - (n - 1))]
-
-
-def create_ngrams(contents):
-    """Convert the content of a file to a list of n-grams"""
-    features = []
-    tags = contents.split()
-    if args.features == 'tokens':
-        for i in range(1, 3):
-            features += get_ngrams(tags, i)
+    if features not in R_FEATURES or balance not in ['balanced', 'unbalanced']:
+        return None
+    return '{}_{}.txt'.format(balance, R_FEATURES[features])
+
+
+def create_label_encoder(languages):
+    """Create the encoder that converts languages to labels (and back)"""
+    from sklearn.preprocessing import LabelEncoder
+    label_encoder = LabelEncoder()
+    label_encoder.fit(languages)
+    return label_encoder
+
+
+def load_data(languages, label_encoder, path, extension):
+    """
+    Create a table with the paths of the documents (see dataset.PathTable), and an array of associated labels.
+    If the dataset was packed (see packed_corpus), the documents are read from the packed corpus,
+    which is returned as well (or None otherwise).
+    """
+    corpus = None
+    if packed_corpus.is_packed(path, languages, extension):
+        print('Using the packed corpus in {}'.format(path))
+        corpus = packed_corpus.PackedCorpus(path, languages, extension)
+    elif packed_corpus.is_stale(path, languages, extension):
+        print('The packed corpus in {} is out of date, reading the files instead (pack them again to use it)'
+              .format(path))
+    filenames, language_indices = dataset.scan(path, languages, extension, corpus)
+    return filenames, label_encoder.transform(languages)[language_indices], corpus
+
+
+def split_data(y, filenames):
+    """
+    Return the (train, test) indices of the cross-validation folds. The copies of a document (when the
+    dataset is oversampled) are always in the same fold, and with args.group_folds all speeches of a report.
+    """
+    if len(y) == 0:
+        sys.exit('No documents were found, check the path and the type of features')
+    # Oversampled copies of a document count as one document
+    n_documents = len(numpy.unique(filenames.indices))
+    if n_documents < args.folds:
+        sys.exit('There are fewer documents ({}) than folds ({})'.format(n_documents, args.folds))
+    if args.group_folds:
+        groups = filenames.report_codes()
+        if len(numpy.unique(groups)) < args.folds:
+            sys.exit('There are fewer reports ({}) than folds ({}), so they cannot be kept in separate folds'
+                     .format(len(numpy.unique(groups)), args.folds))
     else:
-        for i in range(2, 6):
-            features += get_ngrams(tags, i)
-    return features
+        groups = filenames.indices
+    splits = dataset.split_indices(dataset.assign_folds(y, args.folds, groups, args.seed), args.folds)
+    if args.group_folds and any(len(numpy.unique(y[train_index])) < len(numpy.unique(y)) for train_index, _ in splits):
+        sys.exit('The reports of a language are in too few folds, so some folds have no training documents of it')
+    return splits
 
 
-def print_confusion_matrix(classes, matrix):
-    """Print a confusion matrix to the standard output"""
-    print('\t' + '\t'.join(classes))
-    for i, line in enumerate(matrix):
-        print(classes[i], end='\t')
-        print('\t'.join(str(j) for j in line))
+def transform_data(filenames, corpus, features, ngram_range):
+    """
+    Convert the files (or the documents of a packed corpus) into a binary matrix of hashed n-gram features.
+    The result is cached, so the same files are only processed once for each type of features.
+    """
+    import feature_cache
+    with run.stage('transform', total=len(filenames), unit='documents') as stage:
+        # A packed corpus is only used while it matches the original files, and is rewritten when they change
+        key = feature_cache.cache_key(corpus.files() if corpus else filenames, features, ngram_range,
+                                      args.n_features)
+        x = feature_cache.load(args.cache, key)
+        if x is not None:
+            print('Loaded transformed data from the cache')
+            stage.update(len(filenames))
+            return x
+        if corpus:
+            x = corpus.transform(filenames, ngram_range, args.n_features)
+        else:
+            x = ngram_features.transform(filenames, ngram_range, args.n_features)
+        feature_cache.save(args.cache, key, x, filenames)
+        stage.update(len(filenames))
+    return x
 
 
-def show_most_informative_features(vectorizer, label_encoder, pipeline):
-    """Show the most informative features for the given pipeline/classifier"""
+def show_most_informative_features(features, label_encoder, top):
+    """Show the most informative features of every class (see feature_importance.top_features)"""
     print('Analysing most informative features')
-    features = vectorizer.get_feature_names()
-    for label in label_encoder.classes_:
-        i = label_encoder.transform([label])[0]
-        most_informative = numpy.argsort(pipeline.get_params()['clf'].coef_[i])[-10:]
+    for label, most_informative in zip(label_encoder.classes_, top):
         print('{}: {}'.format(label, ' | '.join(str(features[j]) for j in most_informative)))
     print()
 
 
-def main():
-    numpy.random.seed(0)
-    languages = ['DE', 'EN', 'ES', 'FR', 'IT', 'NL']
+def create_pipeline():
+    """Create the (unfitted) classifier pipeline"""
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.svm import LinearSVC
+    # The random state is fixed, so the results do not depend on the order in which folds are fitted
+    return Pipeline([('transformer', TfidfTransformer()),
+                     ('clf', LinearSVC(class_weight='balanced', random_state=0))])
 
+
+def fit_fold(x, y, train_index, test_index):
+    """
+    Fit the classifier on the training part of a fold, and classify the test part.
+    Returns the labels of the test part, the predicted labels and the fitted pipeline.
+    """
+    warnings.filterwarnings("ignore")
+    pipeline = create_pipeline()
+    pipeline.fit(x[train_index], y[train_index])
+    return y[test_index], pipeline.predict(x[test_index]), pipeline
+
+
+def prepare_data(languages, label_encoder):
+    """
+    Load and transform the training data.
+    Returns the feature matrix, the labels, the filenames, the hashed n-gram columns that
+    belong to the columns of the matrix, and the packed corpus (if any).
+    """
     print('Loading filenames and labels...')
-    label_encoder = LabelEncoder()
-    label_encoder.fit(languages)
-    x, y = load_data(languages, label_encoder, args.path, args.extension, args.balance)
+    filenames, y, corpus = load_data(languages, label_encoder, args.path, args.extension)
 
     print('Transforming data...')
-    vectorizer = CountVectorizer(input='filename', preprocessor=None, tokenizer=create_ngrams, binary=True)
     # As the occurence of certain tags won't be influenced by the presence of texts from the testset,
     # we can already transform all data into binary matrices here. This avoids processing the
     # same data multiple times for no good reason.
-    x = vectorizer.fit_transform(x)
-    print('Data transformed into {} features'.format(len(vectorizer.vocabulary_)))
+    # All files are transformed (and cached), even if the dataset is balanced afterwards, so the
+    # same matrix can be used for both settings.
+    x = transform_data(filenames, corpus, args.features, NGRAM_RANGES[args.features])
+    if args.balance:
+        samples = dataset.sample(y, len(languages), args.sampling, args.seed)
+        x, y, filenames = x[samples], y[samples], filenames[samples]
+    # Only keep the columns of the n-grams that occur in the dataset
+    columns = numpy.flatnonzero(x.getnnz(axis=0))
+    x = x[:, columns]
+    print('Data transformed into {} features'.format(len(columns)))
+    return x, y, filenames, columns, corpus
+
+
+def feature_names(x, filenames, columns, corpus):
+    """Return the (lazily decoded) n-grams of the columns of a feature matrix"""
+    return ngram_features.FeatureNames(x, filenames, columns, NGRAM_RANGES[args.features], args.n_features,
+                                       corpus.read_tags if corpus else ngram_features.read_tags)
+
+
+def main():
+    from joblib import Parallel, delayed
+    languages = ['DE', 'EN', 'ES', 'FR', 'IT', 'NL']
+    label_encoder = create_label_encoder(languages)
+    x, y, filenames, columns, corpus = prepare_data(languages, label_encoder)
+    features = feature_names(x, filenames, columns, corpus)
 
     print('Starting cross validation steps:')
-    folds = StratifiedKFold(n_splits=10, shuffle=True)
-    y_total_test = numpy.array([])
-    y_total_observed = numpy.array([])
-    for train_index, test_index in folds.split(x, y):
-        x_train, x_test = x[train_index], x[test_index]
-        y_train, y_test = y[train_index], y[test_index]
-        print('Fitting classifier...')
-        pipeline = Pipeline([('transformer', TfidfTransformer()), ('clf', LinearSVC(class_weight='balanced'))])
-        pipeline.fit(x_train, y_train)
-        y_observed = pipeline.predict(x_test)
+    splits = split_data(y, filenames)
+    # The folds are fitted in parallel. The (large) arrays of the feature matrix are memory mapped
+    # by joblib, so the worker processes share them instead of receiving a copy for every fold.
+    print('Fitting classifiers...')
+    with run.stage('fit folds', total=len(splits), unit='folds') as stage:
+        results = Parallel(n_jobs=args.jobs, max_nbytes='1M', mmap_mode='r')(
+            delayed(fit_fold)(x, y, train_index, test_index) for train_index, test_index in splits)
+        stage.update(len(results))
+    predictions = metrics.Predictions(y)
+    for fold, ((_, test_index), (_, y_observed, _)) in enumerate(zip(splits, results)):
+        predictions.add(fold, test_index, y_observed)
+    matrices, result = metrics.evaluate(y, predictions.predicted, predictions.groups, len(splits), len(languages))
+    importance = feature_importance.FeatureImportance(len(languages), x.shape[1], args.top_features)
+    # Show the results in the order of the folds
+    for fold, (_, _, pipeline) in enumerate(results):
         # Print the most informative features and other metrics
-        show_most_informative_features(vectorizer, label_encoder, pipeline)
+        top = importance.add(pipeline.named_steps['clf'].coef_)
+        show_most_informative_features(features, label_encoder, top)
         print('Showing metrics...')
-        print_confusion_matrix(list(label_encoder.classes_), confusion_matrix(y_test, y_observed))
-        print()
-        print(classification_report(y_test, y_observed, target_names=languages))
-        y_total_test = numpy.concatenate([y_total_test, y_test])
-        y_total_observed = numpy.concatenate([y_total_observed, y_observed])
+        metrics.print_results(matrices, result, fold, languages)
         print()
 
     print('Showing overall metrics...')
-    print_confusion_matrix(list(label_encoder.classes_), confusion_matrix(y_total_test, y_total_observed))
+    overall_matrices, overall = metrics.evaluate(y, predictions.predicted, numpy.zeros(len(y), dtype=int), 1,
+                                                 len(languages))
+    metrics.print_results(overall_matrices, overall, 0, languages)
     print()
-    print(classification_report(y_total_test, y_total_observed, target_names=languages))
+    print('Most informative features over all folds:')
+    importance_rows = importance.rows(languages, features)
+    feature_importance.print_table(importance_rows)
     print()
+    if args.results:
+        names = ['fold {}'.format(fold + 1) for fold in range(len(splits))]
+        metrics.write_results(os.path.join(args.results, 'folds'), matrices, result, languages, names, args.score)
+        feature_importance.write_table(os.path.join(args.results, 'features.csv'), importance_rows)
+        if args.r_score_file:
+            metrics.write_scores(os.path.join(args.results, args.r_score_file), result[args.score])
 
     # If requested, test on a separate testset
     if args.evaluate:
         print('Testing on given test set:')
         print('Fitting classifier...')
-        pipeline = Pipeline([('transformer', TfidfTransformer()), ('clf', LinearSVC(class_weight='balanced'))])
+        with run.stage('fit', total=len(y), unit='documents') as stage:
+            pipeline = create_pipeline()
+            pipeline.fit(x, y)
+            stage.update(len(y))
+        show_most_informative_features(features, label_encoder, feature_importance.top_features(
+            pipeline.named_steps['clf'].coef_, args.top_features))
+        eval_files, eval_y, eval_corpus = load_data(languages, label_encoder, args.evaluate, args.extension)
+        with run.stage('evaluate', total=len(eval_files), unit='documents') as stage:
+            if eval_corpus:
+                eval_x = eval_corpus.transform(eval_files, NGRAM_RANGES[args.features], args.n_features)
+            else:
+                eval_x = ngram_features.transform(eval_files, NGRAM_RANGES[args.features], args.n_features)
+            eval_obs = pipeline.predict(eval_x[:, columns])
+            stage.update(len(eval_files))
+        evaluate_predictions(eval_y, eval_obs, languages)
+
+
+def evaluate_predictions(y, y_observed, languages):
+    """
+    Show (and write) the results on the test set. The predictions can also be scored on
+    non-overlapping subsets and on bootstrap samples of the test set, without refitting the classifier.
+    """
+    matrices, result = metrics.evaluate(y, y_observed, numpy.zeros(len(y), dtype=int), 1, len(languages))
+    metrics.print_results(matrices, result, 0, languages)
+    print()
+    if args.results:
+        metrics.write_results(os.path.join(args.results, 'evaluation'), matrices, result, languages, ['test set'],
+                              args.score)
+    if args.subsets:
+        print('Scores on {} subsets of the test set:'.format(args.subsets))
+        subsets = metrics.stratified_subsets(y, args.subsets)
+        matrices, result = metrics.evaluate(y, y_observed, subsets, args.subsets, len(languages))
+        for subset in range(args.subsets):
+            metrics.print_results(matrices, result, subset, languages)
+            print()
+        print_summary(result[args.score])
+        if args.results:
+            names = ['subset {}'.format(subset + 1) for subset in range(args.subsets)]
+            metrics.write_results(os.path.join(args.results, 'evaluation_subsets'), matrices, result, languages,
+                                  names, args.score)
+            # The R scripts read the scores on the subsets of the Books test set from the books folder
+            if args.r_score_file:
+                os.makedirs(os.path.join(args.results, 'books'), exist_ok=True)
+                metrics.write_scores(os.path.join(args.results, 'books', args.r_score_file), result[args.score])
+    if args.bootstrap:
+        print('Scores on {} bootstrap samples of the test set:'.format(args.bootstrap))
+        matrices = metrics.bootstrap(y, y_observed, args.bootstrap, len(languages))
+        result = metrics.scores(matrices)
+        print_summary(result[args.score])
+        if args.results:
+            names = ['sample {}'.format(sample + 1) for sample in range(args.bootstrap)]
+            metrics.write_results(os.path.join(args.results, 'evaluation_bootstrap'), matrices, result, languages,
+                                  names, args.score)
+
+
+def print_summary(values):
+    """Print the mean, standard deviation and 95% interval of the scores of the subsets or samples"""
+    low, high = numpy.percentile(values, [2.5, 97.5])
+    print('{}: mean {:.4f}, standard deviation {:.4f}, 95% interval {:.4f} - {:.4f}'.format(
+        args.score, numpy.mean(values), numpy.std(values), low, high))
+    print()
+
+
+def train():
+    """Fit the classifier on all training data, and save it to a file"""
+    languages = ['DE', 'EN', 'ES', 'FR', 'IT', 'NL']
+    label_encoder = create_label_encoder(languages)
+    x, y, _, columns, _ = prepare_data(languages, label_encoder)
+    print('Fitting classifier...')
+    with run.stage('fit', total=len(y), unit='documents') as stage:
+        pipeline = create_pipeline()
         pipeline.fit(x, y)
-        show_most_informative_features(vectorizer, label_encoder, pipeline)
-        eval_files = []
-        eval_labels = []
-        for language in languages:
-            files = glob.glob('{}/{}/*{}'.format(args.evaluate, language, args.extension))
-            eval_files += files
-            eval_labels += [language] * len(files)
-        eval_x = vectorizer.transform(eval_files)
-        eval_y = label_encoder.transform(eval_labels)
-        eval_obs = pipeline.predict(eval_x)
-        print(classification_report(eval_y, eval_obs, target_names=languages))
+        stage.update(len(y))
+    model_bundle.save(args.model, pipeline, columns, label_encoder.classes_, args.features, args.extension,
+                      NGRAM_RANGES[args.features], args.n_features)
+    print('Model saved to {}'.format(args.model))
+
+
+def stream():
+    """
+    Cross-validate an incrementally trained classifier, without loading all data into memory.
+    The documents are read in chunks in every pass, and only the document frequencies of the
+    features and the classifiers are kept in memory.
+    """
+    import streaming
+    languages = args.languages or sorted(entry for entry in os.listdir(args.path)
+                                         if os.path.isdir(os.path.join(args.path, entry)) and entry[0] != '.')
+    label_encoder = create_label_encoder(languages)
+    print('Loading filenames and labels...')
+    filenames, y, corpus = load_data(languages, label_encoder, args.path, args.extension)
+    print('Found {} documents in {} languages'.format(len(filenames), len(languages)))
+    cv = streaming.StreamingCrossValidation(filenames, y, label_encoder.classes_, args.folds,
+                                            NGRAM_RANGES[args.features], args.n_features, args.chunk_size, args.alpha,
+                                            corpus=corpus)
+    print('Counting document frequencies...')
+    with run.stage('count', total=len(filenames), unit='documents') as stage:
+        cv.count_documents()
+        stage.update(len(filenames))
+    for epoch in range(args.epochs):
+        print('Training epoch {}/{}...'.format(epoch + 1, args.epochs))
+        with run.stage('epoch {}'.format(epoch + 1), total=len(filenames), unit='documents') as stage:
+            cv.train_epoch()
+            stage.update(len(filenames))
+    print('Classifying documents...')
+    with run.stage('predict', total=len(filenames), unit='documents') as stage:
+        y_observed = cv.predict()
+        stage.update(len(filenames))
+    classes = list(label_encoder.classes_)
+    matrices, result = metrics.evaluate(y, y_observed, cv.folds, args.folds, len(classes))
+    for fold in range(args.folds):
+        print('Fold {} ({} documents):'.format(fold + 1, result['support'][fold].sum()))
+        metrics.print_results(matrices, result, fold, classes)
         print()
+    print('Showing overall metrics...')
+    overall_matrices, overall = metrics.evaluate(y, y_observed, numpy.zeros(len(y), dtype=int), 1, len(classes))
+    metrics.print_results(overall_matrices, overall, 0, classes)
+    print()
+
+
+def sweep():
+    """
+    Cross-validate every combination of the given types of features, n-gram ranges, values of C and
+    balancing settings. The data of every type of features is transformed only once, see sweep.py.
+    """
+    from joblib import Parallel, delayed
+    languages = ['DE', 'EN', 'ES', 'FR', 'IT', 'NL']
+    label_encoder = create_label_encoder(languages)
+    settings = []
+    tasks = []
+    for features in args.features:
+        ngram_ranges = args.ngram_ranges or [NGRAM_RANGES[features]]
+        widest = sweep_module.widest_range(ngram_ranges)
+        print('Loading and transforming {} data ({}-grams)...'.format(features, '-'.join(map(str, widest))))
+        filenames, y_all, corpus = load_data(languages, label_encoder, args.path, EXTENSIONS[features])
+        x_all = transform_data(filenames, corpus, features, widest)
+        for balance in args.balance:
+            if balance == 'unbalanced':
+                samples = numpy.arange(len(y_all))
+            else:
+                samples = dataset.sample(y_all, len(languages), SAMPLING[balance], args.seed)
+            x, y = x_all[samples], y_all[samples]
+            columns = numpy.flatnonzero(x.getnnz(axis=0))
+            x = x[:, columns]
+            # The folds are created as the cv command does, so the results of both are the same
+            splits = split_data(y, filenames[samples])
+            with run.stage('count {} {}'.format(balance, features), total=len(splits), unit='folds') as stage:
+                statistics = sweep_module.FoldStatistics(x, splits)
+                stage.update(len(splits))
+            for ngram_range in ngram_ranges:
+                start, stop = sweep_module.range_slice(columns, ngram_range, widest, args.n_features)
+                for c in args.c:
+                    settings.append((features, balance, ngram_range, c, y, stop - start))
+                    tasks += [(len(settings) - 1, fold, x, y, train_index, test_index,
+                               statistics.document_frequencies[fold], start, stop, c)
+                              for fold, (train_index, test_index) in enumerate(splits)]
+    print('Fitting {} classifiers for {} configurations...'.format(len(tasks), len(settings)))
+    with run.stage('fit', total=len(tasks), unit='folds') as stage:
+        results = Parallel(n_jobs=args.jobs, max_nbytes='1M', mmap_mode='r')(
+            delayed(sweep_module.fit_configuration)(*task[2:]) for task in tasks)
+        stage.update(len(results))
+    predictions = [metrics.Predictions(setting[4]) for setting in settings]
+    for (setting, fold, _, _, _, test_index, _, _, _, _), y_observed in zip(tasks, results):
+        predictions[setting].add(fold, test_index, y_observed)
+    header = ['features', 'balance', 'ngram_range', 'C', 'columns', 'accuracy', 'macro_f1', 'weighted_f1',
+              '{}_std'.format(args.score)]
+    rows = []
+    for (features, balance, ngram_range, c, y, n_columns), fold_predictions in zip(settings, predictions):
+        matrices, result = metrics.evaluate(y, fold_predictions.predicted, fold_predictions.groups, args.folds,
+                                            len(languages))
+        name = '{}-{}'.format(*ngram_range)
+        rows.append([features, balance, name, '{:g}'.format(c), str(n_columns)] +
+                    ['{:.4f}'.format(numpy.mean(result[score])) for score in ['accuracy', 'macro_f1', 'weighted_f1']] +
+                    ['{:.4f}'.format(numpy.std(result[args.score]))])
+        if args.results:
+            prefix = os.path.join(args.results, '{}_{}_{}_C{:g}'.format(balance, features, name, c))
+            names = ['fold {}'.format(fold + 1) for fold in range(args.folds)]
+            metrics.write_results(prefix, matrices, result, languages, names, args.score)
+            # The default configurations are also written under the names that the R scripts read
+            if ngram_range == NGRAM_RANGES[features] and c == 1 and r_score_file(features, balance):
+                metrics.write_scores(os.path.join(args.results, r_score_file(features, balance)), result[args.score])
+    print('\t'.join(header))
+    for row in rows:
+        print('\t'.join(row))
+    with open(args.output, 'w') as file_handle:
+        file_handle.write(''.join(','.join(row) + '\n' for row in [header] + rows))
+    print('Results written to {}'.format(args.output))
+
+
+def read_documents(inputs, extension, read=ngram_features.read_tags):
+    """
+    Yield a (name, tags) tuple for every document in the inputs. The tags of a file are read with the
+    given function (use ngram_features.iter_tags to stream them instead).
+    An input can be a file, or a directory in which all files with the given extension are used.
+    Without inputs, every line of the standard input is a document.
+    """
+    if not inputs:
+        for i, line in enumerate(sys.stdin):
+            yield 'stdin:{}'.format(i + 1), ngram_features.split_tags(line)
+    for path in inputs:
+        if os.path.isdir(path):
+            for filename in sorted(glob.glob('{}/**/*{}'.format(path, extension), recursive=True)):
+                yield filename, read(filename)
+        else:
+            yield path, read(path)
+
+
+def predict():
+    """Classify documents with a saved classifier, and print their source language and decision scores"""
+    model = model_bundle.Model(args.model)
+    inputs = list(args.inputs)
+    if args.files_from:
+        with open(args.files_from, 'r') as file_handle:
+            inputs += [line.strip() for line in file_handle if line.strip()]
+    if args.window:
+        predict_windows(model, inputs)
+        return
+    print('\t'.join(['document', 'language'] + model.classes))
+    documents = read_documents(inputs, model.extension)
+    # Documents are classified in batches, so the scores of a batch are computed at once
+    with run.stage('predict', unit='documents') as stage:
+        while True:
+            batch = list(islice(documents, args.batch_size))
+            if not batch:
+                break
+            scores = model.decision_scores([tags for _, tags in batch])
+            for (name, _), label, row in zip(batch, model.predict(scores), scores):
+                print('\t'.join([name, label] + ['{:.4f}'.format(score) for score in row]))
+            stage.update(len(batch), tokens=sum(len(tags) for _, tags in batch))
+
+
+def predict_windows(model, inputs):
+    """
+    Classify (long) documents in windows of args.window tags, and print the combined prediction of every
+    document, the number of windows that were used, and optionally the prediction of every window
+    """
+    print('\t'.join(['document', 'language'] + model.classes + ['windows']))
+    with run.stage('predict', unit='documents') as stage:
+        for name, tags in read_documents(inputs, model.extension, ngram_features.iter_tags):
+            window_scores, scores = model.classify_windows(model_bundle.split_windows(tags, args.window),
+                                                           args.batch_size, args.aggregate, args.stop_margin,
+                                                           args.min_windows)
+            if args.segments:
+                for i, (label, row) in enumerate(zip(model.predict(window_scores), window_scores)):
+                    print('\t'.join(['{}#{}'.format(name, i + 1), label] + ['{:.4f}'.format(score) for score in row] +
+                                    ['1']))
+            label = model.predict(scores[numpy.newaxis])[0] if len(window_scores) else ''
+            print('\t'.join([name, label] + ['{:.4f}'.format(score) for score in scores] +
+                            [str(len(window_scores))]))
+            stage.update()
 
 
 if __name__ == '__main__':
     # Ignore some numpy warnings
     warnings.filterwarnings("ignore")
     # Parse command line arguments
+    # Running the script without a command cross-validates (and evaluates) the classifier
+    commands = ['cv', 'train', 'predict', 'stream', 'sweep']
+    if len(sys.argv) < 2 or sys.argv[1] not in commands + ['-h', '--help']:
+        sys.argv.insert(1, 'cv')
     argument_parser = argparse.ArgumentParser()
-    argument_parser.add_argument('-b', '--balance', help='Balance the training set', action='store_true')
-    argument_parser.add_argument('-e', '--evaluate',
-                                 help='Test the system on the given dataset after cross-validating.\n'
-                                      'This dataset should have the same directory structure as the training set.',
-                                 metavar=('PATH',), type=str)
-    argument_parser.add_argument('-f', '--features', default='POS',
-                                 help='The type of features to use (default: %(default)s)',
-                                 choices=['tokens', 'POS', 'POS-universal'])
-    argument_parser.add_argument('path', help='The location of the preprocessed training data', type=str)
+    # The options of the instrumentation are available for every command
+    instrumentation_parser = argparse.ArgumentParser(add_help=False)
+    instrumentation.add_arguments(instrumentation_parser)
+    subparsers = argument_parser.add_subparsers(dest='command')
+    # The options that are used for loading the training data
+    data_parser = argparse.ArgumentParser(add_help=False)
+    data_parser.add_argument('-b', '--balance', help='Balance the training set', action='store_true')
+    data_parser.add_argument('--sampling', default='under', choices=['under', 'over'],
+                             help='Balance by randomly undersampling the larger languages, or by randomly '
+                                  'oversampling the smaller languages (default: %(default)s)')
+    data_parser.add_argument('--seed', type=int, default=0,
+                             help='The seed of the random sampling and of the folds (default: %(default)s)')
+    data_parser.add_argument('-f', '--features', default='POS',
+                             help='The type of features to use (default: %(default)s)',
+                             choices=['tokens', 'POS', 'POS-universal'])
+    data_parser.add_argument('-c', '--cache', metavar='PATH', type=str,
+                             help='The location where transformed data is cached (default: PATH/.feature_cache)')
+    data_parser.add_argument('--hash-bits', type=int, default=HASH_BITS, metavar='BITS',
+                             help='The n-grams of each size are hashed into 2^BITS columns (default: %(default)s)')
+    cv_parser = subparsers.add_parser('cv', parents=[data_parser, instrumentation_parser],
+                                      help='Cross-validate the classifier (default when no command is given)')
+    cv_parser.add_argument('-e', '--evaluate',
+                           help='Test the system on the given dataset after cross-validating.\n'
+                                'This dataset should have the same directory structure as the training set.',
+                           metavar=('PATH',), type=str)
+    cv_parser.add_argument('-j', '--jobs', type=int, default=-1,
+                           help='The number of folds that are fitted in parallel (default: all CPUs)')
+    cv_parser.add_argument('--folds', type=int, default=10,
+                           help='The number of cross-validation folds (default: %(default)s)')
+    cv_parser.add_argument('-g', '--group-folds', action='store_true',
+                           help='Keep all speeches of a report (the part of the filename before the first \'.\') '
+                                'in the same fold')
+    cv_parser.add_argument('-k', '--top-features', type=int, default=10, metavar='K',
+                           help='The number of most informative features to show for every language '
+                                '(default: %(default)s)')
+    cv_parser.add_argument('-r', '--results', metavar='DIR', type=str,
+                           help='Write the scores of the folds (and the test set) to DIR as CSV, JSON and score files, '
+                                'and the most informative features to DIR/features.csv. The scores of token and '
+                                'POS systems are also written under the names that the R scripts read '
+                                '(e.g. balanced_pos.txt)')
+    cv_parser.add_argument('--score', default='weighted_f1', choices=['weighted_f1', 'macro_f1', 'accuracy'],
+                           help='The score that is summarized and written to the score files (default: %(default)s)')
+    cv_parser.add_argument('--subsets', type=int, default=0,
+                           help='Also score the test set on this many non-overlapping subsets (e.g. 10)')
+    cv_parser.add_argument('--bootstrap', type=int, default=0, metavar='SAMPLES',
+                           help='Also score the test set on this many bootstrap samples')
+    cv_parser.add_argument('path', help='The location of the preprocessed training data', type=str)
+    train_parser = subparsers.add_parser('train', parents=[data_parser, instrumentation_parser],
+                                         help='Fit the classifier on all training data and save it')
+    train_parser.add_argument('model', help='The file to save the classifier to', type=str)
+    train_parser.add_argument('path', help='The location of the preprocessed training data', type=str)
+    predict_parser = subparsers.add_parser('predict', parents=[instrumentation_parser],
+                                           help='Classify documents with a saved classifier')
+    predict_parser.add_argument('--files-from', metavar='FILE', type=str,
+                                help='Also classify the files listed in FILE (one path per line)')
+    predict_parser.add_argument('--batch-size', type=int, default=1000,
+                                help='The number of documents (or windows) that are classified at once '
+                                     '(default: %(default)s)')
+    predict_parser.add_argument('-w', '--window', type=int, metavar='TAGS',
+                                help='Classify every document in windows of this many tags, and combine the scores '
+                                     'of the windows (for long documents, which are then read gradually)')
+    predict_parser.add_argument('--aggregate', choices=['mean', 'vote'], default='mean',
+                                help='Combine the windows by their mean decision scores, or by the share of the '
+                                     'windows that was assigned to every language (default: %(default)s)')
+    predict_parser.add_argument('--stop-margin', type=float, metavar='MARGIN',
+                                help='Stop reading a document as soon as the combined score of the best language '
+                                     'exceeds that of the second best by MARGIN')
+    predict_parser.add_argument('--min-windows', type=int, default=1,
+                                help='The number of windows to classify before --stop-margin is checked '
+                                     '(default: %(default)s)')
+    predict_parser.add_argument('--segments', action='store_true',
+                                help='Also print the prediction of every window (as <DOCUMENT>#<WINDOW>)')
+    predict_parser.add_argument('model', help='The file with the saved classifier', type=str)
+    predict_parser.add_argument('inputs', nargs='*', type=str,
+                                help='Files or directories to classify (default: every line of the standard input)')
+    stream_parser = subparsers.add_parser('stream', parents=[instrumentation_parser],
+                                          help='Cross-validate an incrementally trained classifier, '
+                                               'for data that does not fit in memory')
+    stream_parser.add_argument('-f', '--features', default='POS',
+                               help='The type of features to use (default: %(default)s)',
+                               choices=['tokens', 'POS', 'POS-universal'])
+    stream_parser.add_argument('--hash-bits', type=int, default=18, metavar='BITS',
+                               help='The n-grams of each size are hashed into 2^BITS columns (default: %(default)s)')
+    stream_parser.add_argument('-l', '--languages', nargs='+', metavar='LANG',
+                               help='The languages to use (default: every directory in PATH)')
+    stream_parser.add_argument('--folds', type=int, default=10,
+                               help='The number of cross-validation folds (default: %(default)s)')
+    stream_parser.add_argument('--chunk-size', type=int, default=1000,
+                               help='The number of documents that are read at once (default: %(default)s)')
+    stream_parser.add_argument('--epochs', type=int, default=5,
+                               help='The number of passes over the training data (default: %(default)s)')
+    stream_parser.add_argument('--alpha', type=float, default=1e-5,
+                               help='The regularization strength of the classifier (default: %(default)s)')
+    stream_parser.add_argument('path', help='The location of the preprocessed training data', type=str)
+    sweep_parser = subparsers.add_parser('sweep', parents=[instrumentation_parser],
+                                         help='Cross-validate a grid of configurations, transforming the data once')
+    sweep_parser.add_argument('-f', '--features', nargs='+', default=['tokens', 'POS'],
+                              choices=['tokens', 'POS', 'POS-universal'],
+                              help='The types of features to compare (default: %(default)s)')
+    sweep_parser.add_argument('-b', '--balance', nargs='+', default=['balanced', 'unbalanced'],
+                              choices=['balanced', 'unbalanced', 'oversampled'],
+                              help='The balancing settings to compare: undersampled, not balanced, or oversampled '
+                                   '(default: %(default)s)')
+    sweep_parser.add_argument('-n', '--ngram-ranges', nargs='+', metavar='RANGE', type=sweep_module.parse_ngram_range,
+                              help='The n-gram ranges to compare, e.g. 1-2 2-5 (default: the range of every type '
+                                   'of features)')
+    sweep_parser.add_argument('-C', dest='c', nargs='+', type=float, default=[1.0],
+                              help='The values of the C parameter of the SVM to compare (default: %(default)s)')
+    sweep_parser.add_argument('--folds', type=int, default=10,
+                              help='The number of cross-validation folds (default: %(default)s)')
+    sweep_parser.add_argument('-g', '--group-folds', action='store_true',
+                              help='Keep all speeches of a report in the same fold (see the cv command)')
+    sweep_parser.add_argument('--seed', type=int, default=0,
+                              help='The seed of the random sampling and of the folds (default: %(default)s)')
+    sweep_parser.add_argument('-c', '--cache', metavar='PATH', type=str,
+                              help='The location where transformed data is cached (default: PATH/.feature_cache)')
+    sweep_parser.add_argument('--hash-bits', type=int, default=HASH_BITS, metavar='BITS',
+                              help='The n-grams of each size are hashed into 2^BITS columns (default: %(default)s)')
+    sweep_parser.add_argument('-j', '--jobs', type=int, default=-1,
+                              help='The number of classifiers that are fitted in parallel (default: all CPUs)')
+    sweep_parser.add_argument('-o', '--output', metavar='FILE', type=str, default='sweep.csv',
+                              help='The file to write the table of results to (default: %(default)s)')
+    sweep_parser.add_argument('-r', '--results', metavar='DIR', type=str,
+                              help='Also write the scores of the folds of every configuration to DIR '
+                                   '(see the cv command), and those of the default configurations under the names '
+                                   'that the R scripts read')
+    sweep_parser.add_argument('--score', default='weighted_f1', choices=['weighted_f1', 'macro_f1', 'accuracy'],
+                              help='The score of which the standard deviation is shown, and that is written to '
+                                   'the score files (default: %(default)s)')
+    sweep_parser.add_argument('path', help='The location of the preprocessed training data', type=str)
     args = argument_parser.parse_args()
+    # The predictions are written to the standard output, so progress is written to the standard error
+    run = instrumentation.start('classify_sk {}'.format(args.command), args,
+                                sys.stderr if args.command == 'predict' else sys.stdout)
+    if args.command == 'predict':
+        predict()
+        sys.exit()
     # Format paths as required
     if args.path and args.path[-1] == '/':
         args.path = args.path[:-1]
-    if args.evaluate and args.evaluate[-1] == '/':
+    if args.command == 'cv' and args.evaluate and args.evaluate[-1] == '/':
         args.evaluate = args.evaluate[:-1]
-    if args.features:
-        extensions = {'tokens': '.txt', 'POS': '.pos', 'POS-universal': '.uni'}
-        args.extension = extensions[args.features]
+    if args.command == 'cv' and (args.subsets or args.bootstrap) and not args.evaluate:
+        cv_parser.error('--subsets and --bootstrap require --evaluate')
+    if args.command in ['cv', 'sweep'] and args.results:
+        os.makedirs(args.results, exist_ok=True)
+    args.n_features = 2 ** args.hash_bits
+    if not getattr(args, 'cache', True):
+        args.cache = args.path + '/.feature_cache'
+    if args.features and args.command != 'sweep':
+        args.extension = EXTENSIONS[args.features]
+    if args.command == 'cv':
+        balance = {method: name for name, method in SAMPLING.items()}[args.sampling] if args.balance else 'unbalanced'
+        args.r_score_file = r_score_file(args.features, balance)
     # Run the main function
-    main()
+    if args.command == 'train':
+        train()
+    elif args.command == 'stream':
+        stream()
+    elif args.command == 'sweep':
+        sweep()
+    else:
+        main()
@@ -3,17 +3,64 @@
 # This script will create versions of text files where all tokens have been replaced by
 # parse rules representing the relationship between tokens. The format of these rules is
 # MAIN_DEPENDENCY DEPENDENCY_IN_SUBTREE [DEPENDENCY_IN_SUBTREE] ...
+# Files that have not changed since they were last parsed are skipped (see preprocess_cache).
 
 import argparse
 import glob
+import os
 import spacy
+from itertools import groupby
+import instrumentation
+import preprocess_cache
+
+MODEL = 'en_core_web_md'
+# The pipeline components of the model that are not needed to create the parse rules. Only tok2vec,
+# tagger, attribute_ruler (which sets the POS-tags) and parser are used.
+EXCLUDED_COMPONENTS = ['senter', 'lemmatizer', 'ner']
+
+
+def read_lines(filenames):
+    """Yield a (line, path) tuple for every line in the given files"""
+    for path in filenames:
+        with open(path, 'r') as file_handle:
+            for line in file_handle:
+                yield line, path
+
+
+def parse_rules(parse):
+    """Return the parse rules of a parsed line"""
+    rules = []
+    for token in parse:
+        # The subtree of a token runs from its left edge to its right edge, so it is a slice of the
+        # parse, which only contains other tokens if those are different tokens
+        if token.left_edge.i != token.right_edge.i:
+            subtree = parse[token.left_edge.i:token.right_edge.i + 1]
+            rules.append('{} {}\n'.format(token.pos_, ' '.join(sub.pos_ for sub in subtree if sub.i != token.i)))
+    return rules
+
+
+def save_rules(cache, path, digest, tagger, rules):
+    """Write the parse rules of a file, and store it in the cache"""
+    preprocess_cache.write_output(path + '.parse', ''.join(rules))
+    preprocess_cache.store(cache, os.path.relpath(path, args.path), '.parse', digest, tagger)
 
 
 def main():
-    nlp = spacy.load('en_core_web_md')
+    # Only the components that are needed for the POS-tags and dependencies are loaded
+    nlp = spacy.load(MODEL, exclude=EXCLUDED_COMPONENTS)
     # Get a list of files to create parse rules for
     filenames = glob.glob('{}/*/*.txt'.format(args.path))
     total = len(filenames)
+    # Files that have not changed since they were last parsed with the same model are skipped.
+    cache = preprocess_cache.connect(args.path)
+    tagger = 'spacy {} {} {}'.format(spacy.__version__, MODEL, nlp.meta['version'])
+    digests = dict()
+    for path in filenames:
+        digest = preprocess_cache.file_hash(path)
+        cached = preprocess_cache.lookup(cache, os.path.relpath(path, args.path))
+        if not preprocess_cache.is_up_to_date(cached, path, '.parse', digest, tagger):
+            digests[path] = digest
+    print('{} files up to date, {} files to parse'.format(total - len(digests), len(digests)))
     # Convert every file to parse rules
     # Every parse rule has the following format:
     # Dependency A B C
@@ -23,26 +70,40 @@ def main():
     # these rules, as the current configuration does NOT consider the order of the
     # features. This can be done by replacing the tokenizer by a function that returns a
     # list of lines instead of a list of tokens/POS-tags.
-    for i, path in enumerate(filenames):
-        with open(path, 'r') as file_handle:
-            with open(path+'.parse', 'w') as file_handle2:
-                for line in file_handle:
-                    parse = nlp(line)
-                    for token in parse:
-                        subtree = [t for t in token.subtree]
-                        if len(subtree) > 1:
-                            print(token.pos_, ' '.join([sub.pos_ for sub in subtree if sub != token]), file=file_handle2)
-        # Print progress every 100 files
-        if i % 100 == 0:
-            print('{}/{} files processed'.format(i, total))
+    # The lines of all files are parsed in batches (and optionally by multiple processes).
+    # nlp.pipe keeps the lines in order, so the lines of a file are parsed one after another.
+    parses = nlp.pipe(read_lines(list(digests)), as_tuples=True, batch_size=args.batch_size, n_process=args.jobs)
+    with run.stage('parse', total=len(digests)) as stage:
+        for i, (path, lines) in enumerate(groupby(parses, key=lambda parse: parse[1])):
+            rules = []
+            tokens = 0
+            for parse, _ in lines:
+                rules += parse_rules(parse)
+                tokens += len(parse)
+            save_rules(cache, path, digests.pop(path), tagger, rules)
+            stage.update(tokens=tokens)
+            if i % 100 == 0:
+                cache.commit()
+        # Files without any lines do not have any parse rules
+        for path, digest in digests.items():
+            save_rules(cache, path, digest, tagger, [])
+            stage.update()
+    cache.commit()
     # Show that the program is finished
     print('All files processed')
 
+
 if __name__ == '__main__':
     # Parse command line arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('path', help='The location of the training data', type=str)
+    parser.add_argument('-b', '--batch-size', type=int, default=1000,
+                        help='The number of lines that are parsed at once (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of processes to use (default: %(default)s)')
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
+    run = instrumentation.start('convert_to_parses', args)
     # Format paths as required
     if args.path and args.path[-1] == '/':
         args.path = args.path[:-1]
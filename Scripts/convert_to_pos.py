@@ -1,44 +1,130 @@
 #!/usr/bin/env python3
 
 # This script will create versions of text files where all tokens have been replaced by their
-# part-of-speech tag.
+# part-of-speech tag. Every file is tagged only once: the universal tags are derived from
+# the tags of NLTKs default tagset, so both versions can be created in the same pass.
+# Files that have not changed since they were last tagged are skipped (see preprocess_cache).
+# NLTK is only imported when the tagger is used, so importing this module (as serve and
+# book_to_txt do) stays cheap.
 
 import argparse
 import glob
-from nltk import pos_tag
-from nltk.tokenize import wordpunct_tokenize
+import os
+from multiprocessing import Pool
+import instrumentation
+import packed_corpus
+import preprocess_cache
+
+EXTENSIONS = {'POS': '.pos', 'POS-universal': '.uni'}
+
+
+def load_tagger():
+    """Load the tagger once for every worker process"""
+    global tagger
+    from nltk.tag import PerceptronTagger
+    tagger = PerceptronTagger()
+
+
+def tag_lines(lines, tagsets):
+    """
+    Tag a list of lines in one batch.
+    Returns a dictionary that maps each of the requested tagsets to a list with a string of tags per line.
+    """
+    from nltk.tag import map_tag
+    from nltk.tokenize import wordpunct_tokenize
+    tagged = tagger.tag_sents([wordpunct_tokenize(line) for line in lines])
+    # This is the same as nltk.pos_tag with and without tagset='universal'
+    tags = [[tag for _, tag in sentence] for sentence in tagged]
+    result = dict()
+    if 'POS' in tagsets:
+        result['POS'] = [' '.join(sentence) for sentence in tags]
+    if 'POS-universal' in tagsets:
+        result['POS-universal'] = [' '.join(map_tag('en-ptb', 'universal', tag) for tag in sentence)
+                                   for sentence in tags]
+    return result
+
+
+def tagger_identity(tagset):
+    """Return a string that identifies the tagger that is used for the given tagset"""
+    import nltk
+    return 'nltk {} perceptron {}'.format(nltk.__version__, tagset)
+
+
+def tag_file(job):
+    """
+    Create the tagged versions of a single text file, unless they are already up to date.
+    Returns the path, the hash of its contents, the tagsets for which a new version was created,
+    and the number of tokens that were tagged.
+    """
+    path, tagsets, cached = job
+    digest = preprocess_cache.file_hash(path)
+    tagsets = [tagset for tagset in tagsets if not preprocess_cache.is_up_to_date(
+        cached, path, EXTENSIONS[tagset], digest, tagger_identity(tagset))]
+    tokens = 0
+    if tagsets:
+        with open(path, 'r') as file_handle:
+            lines = file_handle.readlines()
+        for tagset, tagged_lines in tag_lines(lines, tagsets).items():
+            preprocess_cache.write_output(path + EXTENSIONS[tagset], ''.join(line + '\n' for line in tagged_lines))
+            tokens = sum(len(line.split()) for line in tagged_lines)
+    return path, digest, tagsets, tokens
 
 
 def main():
     # Get a list of files to create tagged versions of
     filenames = glob.glob('{}/*/*.txt'.format(args.path))
     total = len(filenames)
-    # Convert every file to its tagged version
-    for i, path in enumerate(filenames):
-        with open(path, 'r') as file_handle:
-            with open(path+args.extension, 'w') as file_handle2:
-                for line in file_handle:
-                    if args.features == 'POS':
-                        print(' '.join([pos for _, pos in pos_tag(wordpunct_tokenize(line))]), file=file_handle2)
-                    elif args.features == 'POS-universal':
-                        print(' '.join([pos for _, pos in pos_tag(wordpunct_tokenize(line), tagset='universal')]), file=file_handle2)
-        # Print progress every 100 files
-        if i % 100 == 0:
-            print('{}/{} files tagged'.format(i, total))
+    # Files that have not changed since they were last tagged are skipped
+    cache = preprocess_cache.connect(args.path)
+    hits = 0
+    # Load the tagger here first, so a missing tagger model is reported once, instead of making
+    # every worker process fail (and be restarted) forever
+    load_tagger()
+    # Convert every file to its tagged version(s).
+    # The files are spread over multiple processes, which each load the tagger once.
+    with run.stage('tag', total=total) as stage, Pool(args.jobs, initializer=load_tagger) as pool:
+        jobs = [(path, args.tagsets, preprocess_cache.lookup(cache, os.path.relpath(path, args.path)))
+                for path in filenames]
+        for i, (path, digest, tagsets, tokens) in enumerate(pool.imap_unordered(tag_file, jobs, chunksize=16)):
+            for tagset in tagsets:
+                preprocess_cache.store(cache, os.path.relpath(path, args.path), EXTENSIONS[tagset], digest,
+                                       tagger_identity(tagset))
+            if not tagsets:
+                hits += 1
+            stage.update(tokens=tokens)
+            if i % 100 == 0:
+                cache.commit()
+    cache.commit()
     # Show that the program is finished
-    print('All files tagged')
+    print('All files tagged ({} up to date, {} tagged)'.format(hits, total - hits))
+    if args.pack:
+        languages = sorted({os.path.basename(os.path.dirname(path)) for path in filenames})
+        with run.stage('pack', total=len(languages) * len(args.tagsets), unit='languages') as stage:
+            for tagset in args.tagsets:
+                for language in languages:
+                    packed_corpus.pack(args.path, language, EXTENSIONS[tagset])
+                    stage.update()
+
 
 if __name__ == '__main__':
     # Parse command line arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('path', help='The location of the training data', type=str)
-    parser.add_argument('-f', '--features', default='POS', help='The type of features to use (default: %(default)s)', choices=['POS', 'POS-universal'])
+    parser.add_argument('-f', '--features', default='both', help='The type of features to use (default: %(default)s)',
+                        choices=['POS', 'POS-universal', 'both'])
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='The number of processes to use (default: the number of CPUs)')
+    parser.add_argument('-p', '--pack', action='store_true',
+                        help='Also store the tagged files of every language in packed form (see packed_corpus)')
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
+    run = instrumentation.start('convert_to_pos', args)
     # Format paths as required
     if args.path and args.path[-1] == '/':
         args.path = args.path[:-1]
-    if args.features:
-        extensions = {'POS': '.pos', 'POS-universal': '.uni'}
-        args.extension = extensions[args.features]
+    if args.features == 'both':
+        args.tagsets = ['POS', 'POS-universal']
+    else:
+        args.tagsets = [args.features]
     # Run the main function
     main()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+# Helper functions for reading the gzipped xml files of the Europarl and Books corpora.
+# The files are parsed incrementally, so only a single element has to be kept in memory
+# at any time instead of the whole decompressed document.
+
+import gzip
+import os
+import xml.etree.ElementTree as ET
+
+
+def report_code(path):
+    """Return the name of a corpus file without its directory and '.xml.gz' extension"""
+    return os.path.basename(path)[:-7]
+
+
+def iter_elements(path, tag):
+    """
+    Yield every complete element with the given tag from a gzipped xml file.
+    An element (and everything that was parsed before it) is cleared as soon as the
+    caller asks for the next one, so it should not be stored.
+    """
+    with gzip.open(path, 'rb') as file_handle:
+        root = None
+        for event, element in ET.iterparse(file_handle, events=('start', 'end')):
+            if root is None:
+                root = element
+            if event == 'end' and element.tag == tag:
+                yield element
+                element.clear()
+                root.clear()
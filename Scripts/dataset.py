@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# This module lists the documents of a dataset (a folder for every language), and plans how they are
+# sampled and split into folds. Every folder is scanned once, and a document is identified by an integer:
+# its path is only built when it is needed, from the folder and the name of the document. Balancing
+# (random under- or oversampling) and the assignment of documents to folds are seeded, so they do not
+# depend on the order in which the file system lists the files, and give the same result every run.
+
+import numpy
+import os
+import metrics
+
+
+class PathTable:
+    """
+    The paths of a list of documents, stored as the folder and the name of every document.
+    Indexing with an integer returns the path of a document; indexing with an array of indices returns
+    a PathTable with those documents, which shares the folders and names with this one.
+    """
+
+    def __init__(self, directories, names, directory_ids, indices=None):
+        self.directories = directories
+        self.names = names
+        self.directory_ids = directory_ids
+        # The documents of this table, as indices into names (the integer IDs of the documents)
+        self.indices = numpy.arange(len(names)) if indices is None else indices
+
+    def path(self, document):
+        """Return the path of a document, given its ID"""
+        return '{}/{}'.format(self.directories[self.directory_ids[document]], self.names[document])
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, numpy.integer)):
+            return self.path(self.indices[i])
+        return PathTable(self.directories, self.names, self.directory_ids, self.indices[i])
+
+    def __iter__(self):
+        return map(self.path, self.indices)
+
+    def report_codes(self):
+        """
+        Return an integer for every document that identifies its report (the part of its name before the
+        first '.', as split_data names the speeches), so all speeches of a report get the same integer
+        """
+        codes = [self.names[document].split('.', 1)[0] for document in self.indices]
+        return numpy.unique(codes, return_inverse=True)[1]
+
+
+def scan(path, languages, extension, corpus=None):
+    """
+    List the documents with the given extension in the folder of every language, or the documents of a
+    packed corpus (see packed_corpus). A language without a folder has no documents. Returns a PathTable with
+    the documents (sorted by name within every language), and the index of the language of every document.
+    """
+    names = []
+    counts = []
+    for language in languages:
+        if corpus:
+            language_names = corpus.languages[language].names
+        elif not os.path.isdir('{}/{}'.format(path, language)):
+            # A test set does not need to contain every language
+            language_names = []
+        else:
+            with os.scandir('{}/{}'.format(path, language)) as entries:
+                language_names = sorted(entry.name for entry in entries if entry.name.endswith(extension) and
+                                        not entry.name.startswith('.') and entry.is_file())
+        names += language_names
+        counts.append(len(language_names))
+    directory_ids = numpy.repeat(numpy.arange(len(languages), dtype=numpy.int16), counts)
+    directories = ['{}/{}'.format(path, language) for language in languages]
+    return PathTable(directories, names, directory_ids), numpy.repeat(numpy.arange(len(languages)), counts)
+
+
+def sample(y, classes, method='under', seed=0):
+    """
+    Return the (sorted) indices of a balanced sample of the documents, with the same number of documents
+    for every class. With method 'under', every class gets as many documents as the smallest class, chosen
+    at random. With 'over', every class gets as many as the largest class, by adding random duplicates.
+    """
+    random = numpy.random.RandomState(seed)
+    counts = numpy.bincount(y, minlength=classes)
+    size = counts.min() if method == 'under' else counts.max()
+    samples = []
+    for label in range(classes):
+        indices = numpy.flatnonzero(y == label)
+        if method == 'under':
+            chosen = random.choice(indices, size, replace=False)
+        else:
+            chosen = numpy.concatenate([indices, random.choice(indices, size - len(indices))])
+        samples.append(numpy.sort(chosen))
+    return numpy.concatenate(samples)
+
+
+def assign_folds(y, n_folds, groups, seed=0):
+    """
+    Assign every document to a fold, so that all documents of a group are in the same fold and every
+    fold has about the same number of documents of every class. Returns the fold of every document.
+    """
+    n_classes = y.max() + 1 if len(y) else 0
+    unique, inverse = numpy.unique(groups, return_inverse=True)
+    counts = numpy.bincount(inverse * n_classes + y, minlength=len(unique) * n_classes).reshape(-1, n_classes)
+    if len(unique) == 0 or (counts > 0).sum(axis=1).max() == 1:
+        # Every group has a single class (e.g. when the groups are the documents), so the groups of every
+        # class can simply be dealt to the folds
+        return metrics.stratified_subsets(counts.argmax(axis=1), n_folds, seed)[inverse]
+    # Otherwise, the groups are assigned from large to small (in random order for groups of the same size),
+    # each to the fold that has the fewest documents of the classes in the group so far
+    random = numpy.random.RandomState(seed)
+    order = random.permutation(len(unique))
+    order = order[numpy.argsort(-counts[order].sum(axis=1), kind='stable')]
+    fold_counts = numpy.zeros((n_folds, n_classes))
+    group_folds = numpy.empty(len(unique), dtype=numpy.int64)
+    for group in order:
+        fold = numpy.argmin(fold_counts @ counts[group] + 1e-9 * fold_counts.sum(axis=1))
+        fold_counts[fold] += counts[group]
+        group_folds[group] = fold
+    return group_folds[inverse]
+
+
+def split_indices(folds, n_folds):
+    """Return the (train, test) index arrays of every fold, given the fold of every document"""
+    order = numpy.argsort(folds, kind='stable')
+    bounds = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(folds, minlength=n_folds))])
+    return [(numpy.sort(numpy.concatenate([order[:bounds[fold]], order[bounds[fold + 1]:]])),
+             order[bounds[fold]:bounds[fold + 1]]) for fold in range(n_folds)]
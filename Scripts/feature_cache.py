@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# This module stores the feature matrices created by classify_sk on disk, so they do not
+# have to be created again when the classifier is run on the same data with the same features.
+# A matrix is stored as three numpy arrays (the CSR data, indices and index pointers), which are
+# memory mapped when they are loaded, together with the files that were used to create it.
+
+import hashlib
+import json
+import numpy
+import os
+from scipy import sparse
+
+
+def cache_key(filenames, features, ngram_range, n_features):
+    """
+    Return a key that identifies a feature matrix.
+    The key depends on the names, sizes and modification times of the files, the type of
+    features, the n-gram range and the number of hashed features, so it changes whenever one
+    of these changes.
+    """
+    settings = '{} {} {} {}\n'.format(features, ngram_range[0], ngram_range[1], n_features)
+    key = hashlib.sha1(settings.encode('utf-8'))
+    for filename in filenames:
+        stat = os.stat(filename)
+        key.update('{} {} {}\n'.format(filename, stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    return key.hexdigest()
+
+
+def load(directory, key):
+    """Load a cached feature matrix. Returns None if the matrix is not in the cache."""
+    prefix = os.path.join(directory, key)
+    if not os.path.exists(prefix + '.json'):
+        return None
+    with open(prefix + '.json', 'r') as file_handle:
+        metadata = json.load(file_handle)
+    matrix = sparse.csr_matrix((numpy.load(prefix + '.data.npy', mmap_mode='r'),
+                                numpy.load(prefix + '.indices.npy', mmap_mode='r'),
+                                numpy.load(prefix + '.indptr.npy', mmap_mode='r')),
+                               shape=metadata['shape'], copy=False)
+    return matrix
+
+
+def save(directory, key, matrix, filenames):
+    """Store a feature matrix, together with the list of files it was created from"""
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, key)
+    numpy.save(prefix + '.data.npy', matrix.data)
+    numpy.save(prefix + '.indices.npy', matrix.indices)
+    numpy.save(prefix + '.indptr.npy', matrix.indptr)
+    # The metadata is written last, as its presence denotes that the matrix is complete
+    with open(prefix + '.json', 'w') as file_handle:
+        json.dump({'shape': matrix.shape, 'filenames': list(filenames)}, file_handle)
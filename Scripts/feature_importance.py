@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# This module finds the most informative features of the classifier: the features with the highest
+# SVM coefficients for every language. Only the top k features are selected (with argpartition instead
+# of sorting all coefficients), and only those are decoded to n-grams. The coefficients of the classifiers
+# of all folds are combined, so it can be seen how stable the most informative features are.
+
+import csv
+import numpy
+
+
+def top_features(coef, k):
+    """
+    Return the indices of the k features with the highest coefficients for every class (a row of coef),
+    with the most informative feature last
+    """
+    k = min(k, coef.shape[1])
+    top = numpy.argpartition(coef, -k, axis=1)[:, -k:]
+    order = numpy.argsort(numpy.take_along_axis(coef, top, axis=1), axis=1)
+    return numpy.take_along_axis(top, order, axis=1)
+
+
+class FeatureImportance:
+    """The coefficients of the classifiers of multiple folds, and how often features were in their top k"""
+
+    def __init__(self, n_classes, n_features, k):
+        self.k = k
+        self.n_folds = 0
+        self.sum = numpy.zeros((n_classes, n_features))
+        self.squares = numpy.zeros((n_classes, n_features))
+        # The number of folds in which a feature was in the top k, and the sum of its ranks in those folds
+        self.in_top = numpy.zeros((n_classes, n_features), dtype=numpy.int32)
+        self.ranks = numpy.zeros((n_classes, n_features), dtype=numpy.int32)
+
+    def add(self, coef):
+        """Add the coefficients of the classifier of a fold. Returns its top k features (see top_features)."""
+        self.n_folds += 1
+        self.sum += coef
+        self.squares += coef ** 2
+        top = top_features(coef, self.k)
+        rows = numpy.repeat(numpy.arange(len(coef)), top.shape[1])
+        self.in_top[rows, top.ravel()] += 1
+        # The most informative feature has rank 1
+        self.ranks[rows, top.ravel()] += numpy.tile(numpy.arange(top.shape[1], 0, -1), len(coef))
+        return top
+
+    def rows(self, classes, features):
+        """
+        Return a row for each of the top k features of every class, by their mean coefficient over the folds:
+        (class, rank, n-gram, mean coefficient, standard deviation, the fraction of the folds in which it was
+        in the top k, and its mean rank in those folds). Only the selected features are decoded.
+        """
+        mean = self.sum / self.n_folds
+        std = numpy.sqrt(numpy.maximum(self.squares / self.n_folds - mean ** 2, 0))
+        rows = []
+        for i, label in enumerate(classes):
+            for rank, j in enumerate(top_features(mean[i:i + 1], self.k)[0][::-1]):
+                in_top = self.in_top[i, j]
+                rows.append((label, rank + 1, str(features[j]), mean[i, j], std[i, j], in_top / self.n_folds,
+                             self.ranks[i, j] / in_top if in_top else float('nan')))
+        return rows
+
+
+def print_table(rows):
+    """Print the rows of a FeatureImportance to the standard output"""
+    print('language\trank\tn-gram\tmean coefficient\tstandard deviation\tin top k\tmean rank')
+    for label, rank, ngram, mean, std, in_top, mean_rank in rows:
+        print('{}\t{}\t{}\t{:.4f}\t{:.4f}\t{:.0%}\t{:.1f}'.format(label, rank, ngram, mean, std, in_top, mean_rank))
+
+
+def write_table(filename, rows):
+    """Write the rows of a FeatureImportance to a CSV file"""
+    with open(filename, 'w', newline='') as file_handle:
+        writer = csv.writer(file_handle)
+        writer.writerow(['language', 'rank', 'ngram', 'mean_coef', 'std_coef', 'top_k_folds', 'mean_rank'])
+        for label, rank, ngram, mean, std, in_top, mean_rank in rows:
+            writer.writerow([label, rank, ngram, '{:.6f}'.format(mean), '{:.6f}'.format(std),
+                             '{:.3f}'.format(in_top), '{:.2f}'.format(mean_rank)])
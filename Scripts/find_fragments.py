@@ -3,82 +3,172 @@
 # This script analyses the language tags in the Europarl corpus. It will only select
 # speeches that are available in English, and if they are originally in English,
 # it will check that the text is produced by a MEP from the UK.
+# All speeches are stored in an index (see fragment_index), so running the script again
+# only scans the files of the corpus that have changed.
 
 import argparse
 import glob
-import gzip
+import hashlib
 import os
-import xml.etree.ElementTree as ET
+import re
 from collections import defaultdict
+from multiprocessing import Pool
 from whoswho import who
+from whoswho.utils import make_ascii, strip_punctuation
+from corpus_xml import iter_elements, report_code
+import fragment_index
+import instrumentation
 
 
-def get_available():
+def name_keys(name):
     '''
-    Creates a set that contains information on whether a speech can be found in the English part of Europarl.
-    The information represented by a tuple in the format (file-ID, speaker-ID).
+    Splits a name into lowercase ascii words, in the same way whoswho normalizes names
+    before comparing them.
     '''
-    available = set()
-    for path in glob.glob('./en/*.xml.gz'):
-        report_code = path.split('/')[-1][:-7]
-        with gzip.open(path, 'rb') as file_handle:
-            tree = ET.fromstring(file_handle.read())
-        for fragment in tree.findall('.//SPEAKER[@ID]'):
-            available.add((report_code, fragment.get('ID')))
-    return available
+    return [word for word in re.split(r'[\s,]+', strip_punctuation(make_ascii(name))) if word]
+
+
+class MepMatcher:
+    '''
+    Index of the names of the MEPs from the United Kingdom.
+    whoswho only matches two names if their last names are equal and their first names start
+    with the same letter, so the names are indexed by (last name, first initial). A speaker's
+    name is then only compared to the few MEPs that share such a key with one of its words,
+    instead of to every MEP. The result is remembered for every distinct name, as the same
+    speakers appear in thousands of sessions.
+    '''
+
+    def __init__(self, names):
+        self.exact = set()
+        self.candidates = defaultdict(list)
+        self.cache = dict()
+        for name in names:
+            words = name_keys(name)
+            if words:
+                self.exact.add(' '.join(words))
+                self.candidates[(words[-1], words[0][0])].append(name)
+
+    def match(self, name):
+        '''Returns whether the name is likely to belong to one of the MEPs in the index'''
+        if name not in self.cache:
+            self.cache[name] = self._match(name)
+        return self.cache[name]
+
+    def _match(self, name):
+        words = name_keys(name)
+        if ' '.join(words) in self.exact:
+            return True
+        initials = {word[0] for word in words}
+        for last_name in words:
+            for initial in initials:
+                for possible_name in self.candidates.get((last_name, initial), ()):
+                    if who.match(name, possible_name):
+                        return True
+        return False
 
 
 def is_british(name):
     '''Returns whether a speaker is likely to be an MEP from the United Kingdom'''
-    for possible_name in en_meps:
-        if who.match(name, possible_name):
-            return True
-    return False
+    return name is not None and en_meps.match(name)
+
+
+def scan_file(path):
+    '''
+    Scans a single file of the corpus in one pass.
+    Returns the path and report code of the file, and a (speaker-ID, available, language) tuple for
+    every speech in the file. available denotes whether the file is part of the English corpus (so we
+    know which speeches are available in English). language is the language tag of the speech if it
+    was not said in English, or if it was said in English by a UK MEP, and None otherwise.
+    '''
+    english = os.path.basename(os.path.dirname(path)) == 'en'
+    speakers = []
+    for fragment in iter_elements(path, 'SPEAKER'):
+        language = fragment.get('LANGUAGE')
+        if language == 'EN' and not is_british(fragment.get('NAME')):
+            language = None
+        speakers.append((fragment.get('ID'), english, language))
+    return path, report_code(path), speakers
+
+
+def set_meps(meps):
+    '''Makes the index of MEPs available to the worker processes'''
+    global en_meps
+    en_meps = meps
+
+
+def update_index(connection):
+    '''
+    Scans all files of the corpus that are not in the index yet, or that have changed since they were
+    indexed, and removes files that no longer exist from the index.
+    '''
+    # The index is only valid for the list of MEPs it was built with
+    with open(args.meps, 'rb') as file_handle:
+        meps_hash = hashlib.sha1(file_handle.read()).hexdigest()
+    if fragment_index.get_setting(connection, 'meps') != meps_hash:
+        fragment_index.clear(connection)
+        fragment_index.set_setting(connection, 'meps', meps_hash)
+    indexed = fragment_index.file_states(connection)
+    changed = []
+    for path in sorted(glob.glob('{}*/*.xml.gz'.format(args.path))):
+        stat = os.stat(path)
+        if indexed.pop(os.path.relpath(path, args.path), None) != (stat.st_size, stat.st_mtime):
+            changed.append((path, stat))
+    for path in indexed:
+        fragment_index.remove_file(connection, path)
+    print('{} new or changed files, {} removed files'.format(len(changed), len(indexed)))
+    # Search through the changed files and store all speeches in the index, together with whether
+    # they are available in English, and their language tag if they were said by UK MEPs in English,
+    # or were not said in English.
+    # Every file is read only once, and the files are spread over multiple processes.
+    # The index is committed regularly, so an interrupted scan can be continued later on.
+    stats = dict(changed)
+    with run.stage('scan', total=len(stats)) as stage, \
+            Pool(args.jobs, initializer=set_meps, initargs=(en_meps,)) as pool:
+        for i, (path, code, speakers) in enumerate(pool.imap_unordered(scan_file, stats, chunksize=8)):
+            fragment_index.store_file(connection, os.path.relpath(path, args.path),
+                                      stats[path].st_size, stats[path].st_mtime, code, speakers)
+            stage.update()
+            if i % 100 == 0:
+                connection.commit()
+    connection.commit()
 
 
 def main():
-    id_to_lang = defaultdict(set)
-    available = get_available()
-    # Search through the corpus and put all speeches that were said by UK MEPS in English,
-    # and all speeches that were not said in English, but do have a language tag in a dictionary.
-    for path in glob.glob('{}*/*.xml.gz'.format(args.path)):
-        report_code = path.split('/')[-1][:-7]
-        with gzip.open(path, 'rb') as file_handle:
-            tree = ET.fromstring(file_handle.read())
-        for fragment in tree.findall('.//SPEAKER[@LANGUAGE]'):
-            if fragment.get('LANGUAGE') != 'EN' or (
-                            fragment.get('LANGUAGE') == 'EN' and is_british(fragment.get('NAME'))):
-                id_to_lang[(report_code, fragment.get('ID'))].add(fragment.get('LANGUAGE'))
-    file_handles = dict()
     # Create a folder where all information can be stored
     if not os.path.exists('./fragment_data'):
         os.mkdir('./fragment_data')
+    connection = fragment_index.connect(args.index)
+    update_index(connection)
     # Go through the collected data, and write the file-IDs and speaker-IDs to files:
     # If the speech is not available in English, ignore it.
     # If there are multiple language tags for a single fragment, ignore it.
     # The filenames are based on the spoken language.
     # The information is written as "FileID,SpeakerID" (without quotes, one tuple per line).
-    for key in id_to_lang:
-        if len(id_to_lang[key]) == 1:
-            language = id_to_lang[key].pop()
-            if language not in file_handles:
-                file_handles[language] = open('./fragment_data/{}.txt'.format(language), 'w')
-            if key in available:
-                print('{},{}'.format(*key), file=file_handles[language])
-            for language in file_handles:
-                file_handles[language].close()
+    file_handles = dict()
+    for code, speaker_id, language in fragment_index.fragments(connection):
+        if language not in file_handles:
+            file_handles[language] = open('./fragment_data/{}.txt'.format(language), 'w')
+        print('{},{}'.format(code, speaker_id), file=file_handles[language])
+    for language in file_handles:
+        file_handles[language].close()
+    connection.close()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('path', type=str, help='The path where the \'raw\' folder of Europarl can be found.')
     parser.add_argument('meps', type=str, help='The path where a list of MEPs can be found.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='The number of processes to use (default: the number of CPUs)')
+    parser.add_argument('-i', '--index', type=str, default='./fragment_data/fragments.db',
+                        help='The index that keeps track of the files that were already scanned '
+                             '(default: %(default)s)')
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
+    run = instrumentation.start('find_fragments', args)
     # Add a slash at the end of the path, if it is missing
     if args.path[-1] != '/':
         args.path += '/'
-    en_meps = set()
     with open(args.meps, 'r') as fh:
-        for line in fh:
-            en_meps.add(line)
+        en_meps = MepMatcher(line.strip() for line in fh)
     main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# This module manages the persistent index of speeches in the Europarl corpus that is
+# built by the find_fragments script. The index is a SQLite database that contains every
+# speaker fragment of every file in the corpus, together with the size and modification
+# time of those files. This makes it possible to only scan files that were changed or added
+# since the last run, and lets the other scripts query the fragments directly.
+
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL);
+CREATE TABLE IF NOT EXISTS speakers (
+    path TEXT,
+    report_code TEXT,
+    speaker_id TEXT,
+    available INTEGER,
+    language TEXT
+);
+CREATE INDEX IF NOT EXISTS speakers_path ON speakers (path);
+CREATE INDEX IF NOT EXISTS speakers_key ON speakers (report_code, speaker_id);
+CREATE VIEW IF NOT EXISTS fragments AS
+    SELECT tagged.report_code, tagged.speaker_id, tagged.language
+    FROM (
+        SELECT report_code, speaker_id, MIN(language) AS language, COUNT(DISTINCT language) AS languages
+        FROM speakers
+        WHERE language IS NOT NULL AND speaker_id IS NOT NULL
+        GROUP BY report_code, speaker_id
+    ) AS tagged
+    WHERE tagged.languages = 1 AND EXISTS (
+        SELECT 1 FROM speakers
+        WHERE available AND report_code = tagged.report_code AND speaker_id = tagged.speaker_id
+    );
+'''
+
+
+def connect(path):
+    """Open (and create if needed) the index at the given path"""
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def get_setting(connection, key):
+    """Return a value that was stored with set_setting, or None"""
+    row = connection.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_setting(connection, key, value):
+    """Store a value in the index, e.g. to detect that the list of MEPs has changed"""
+    connection.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', (key, value))
+
+
+def clear(connection):
+    """Remove all files and fragments from the index"""
+    connection.execute('DELETE FROM speakers')
+    connection.execute('DELETE FROM files')
+
+
+def file_states(connection):
+    """Return a dictionary that maps every indexed file to its (size, mtime)"""
+    return {path: (size, mtime) for path, size, mtime in connection.execute('SELECT * FROM files')}
+
+
+def remove_file(connection, path):
+    """Remove a file and its fragments from the index"""
+    connection.execute('DELETE FROM speakers WHERE path = ?', (path,))
+    connection.execute('DELETE FROM files WHERE path = ?', (path,))
+
+
+def store_file(connection, path, size, mtime, report_code, fragments):
+    """
+    Replace the fragments of a file in the index.
+    fragments should contain a (speaker-ID, available, language) tuple for every speaker in the file,
+    where available denotes whether the speech is part of the English corpus, and language is the
+    language tag of the speech, or None if the speech should not be used.
+    """
+    remove_file(connection, path)
+    connection.executemany('INSERT INTO speakers VALUES (?, ?, ?, ?, ?)',
+                           ((path, report_code, speaker_id, available, language)
+                            for speaker_id, available, language in fragments))
+    connection.execute('INSERT INTO files VALUES (?, ?, ?)', (path, size, mtime))
+
+
+def fragments(connection, languages=None):
+    """
+    Yield a (report code, speaker-ID, language) tuple for every speech that is available in English
+    and has a single language tag, sorted by report code and speaker-ID.
+    If a list of languages is given, only speeches in those languages are returned.
+    """
+    query = 'SELECT * FROM fragments'
+    parameters = ()
+    if languages is not None:
+        parameters = tuple(languages)
+        query += ' WHERE language IN ({})'.format(', '.join('?' * len(parameters)))
+    return connection.execute(query + ' ORDER BY report_code, speaker_id', parameters)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# This module measures the stages of the scripts: their wall time, the number of processed items
+# (files, reports, documents) and tokens per second, the peak memory use and the expected remaining
+# time. Progress is printed for humans, and can also be written as JSON lines (--metrics), so the
+# stages of different runs can be compared. The main process can also be profiled with cProfile
+# (--profile), and the resulting file can be opened with pstats, snakeviz or similar tools.
+
+import atexit
+import cProfile
+import json
+import resource
+import sys
+import time
+
+
+def add_arguments(parser):
+    """Add the options of the instrumentation to an argument parser"""
+    parser.add_argument('--metrics', metavar='FILE', type=str,
+                        help='Append the measurements of every stage to FILE as JSON lines')
+    parser.add_argument('--profile', metavar='FILE', type=str,
+                        help='Profile the main process with cProfile, and save the statistics to FILE')
+    parser.add_argument('--progress-interval', metavar='SECONDS', type=float, default=10,
+                        help='The minimum number of seconds between progress messages (default: %(default)s)')
+
+
+def start(script, args, output=sys.stdout):
+    """
+    Start instrumenting a script with the options of add_arguments. Progress is printed to output,
+    and the profile is written on exit.
+    """
+    run = Instrumentation(script, getattr(args, 'metrics', None), getattr(args, 'profile', None),
+                          getattr(args, 'progress_interval', 10), output)
+    atexit.register(run.close)
+    return run
+
+
+def peak_memory():
+    """
+    Return the peak resident memory (in MB) of this process, and of the largest of its
+    finished child processes (e.g. the workers of a pool).
+    """
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Instrumentation:
+    """The measurements of a single run of a script"""
+
+    def __init__(self, script, metrics=None, profile=None, interval=10, output=sys.stdout):
+        self.script = script
+        self.output = output
+        self.metrics = open(metrics, 'a') if metrics else None
+        self.profile = profile
+        self.interval = interval
+        self.profiler = None
+        if profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stage(self, name, total=None, unit='files'):
+        """Return a stage, which measures the time between entering and leaving it (with with)"""
+        return Stage(self, name, total, unit)
+
+    def write(self, record):
+        """Write a record to the metrics file, if there is one"""
+        if self.metrics:
+            record = dict(script=self.script, time=time.time(), **record)
+            self.metrics.write(json.dumps(record) + '\n')
+            self.metrics.flush()
+
+    def close(self):
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile)
+            self.profiler = None
+        if self.metrics:
+            self.metrics.close()
+            self.metrics = None
+
+
+class Stage:
+    """
+    A stage of a script. Call update for every processed item (or batch of items), optionally with
+    the number of tokens it contained, to show the progress.
+    """
+
+    def __init__(self, run, name, total, unit):
+        self.run = run
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.items = 0
+        self.tokens = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        memory, children_memory = peak_memory()
+        record = self.record(seconds)
+        record.update(event='end', peak_rss_mb=memory, children_peak_rss_mb=children_memory)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        self.run.write(record)
+        message = '{}: {} in {}'.format(self.name, self.describe(seconds), format_duration(seconds))
+        print('{}, peak memory {:.0f} MB (workers {:.0f} MB)'.format(message, memory, children_memory),
+              file=self.run.output)
+
+    def record(self, seconds):
+        record = {'stage': self.name, 'seconds': seconds, 'items': self.items, 'unit': self.unit,
+                  'items_per_second': self.items / seconds if seconds else None}
+        if self.total is not None:
+            record['total'] = self.total
+        if self.tokens:
+            record.update(tokens=self.tokens, tokens_per_second=self.tokens / seconds if seconds else None)
+        return record
+
+    def describe(self, seconds):
+        """Describe the number of processed items and tokens, and their rates"""
+        items = str(self.items) if self.total is None else '{}/{}'.format(self.items, self.total)
+        description = '{} {} ({:.1f}/s'.format(items, self.unit, self.items / seconds if seconds else 0)
+        if self.tokens:
+            description += ', {:.0f} tokens/s'.format(self.tokens / seconds if seconds else 0)
+        return description + ')'
+
+    def update(self, items=1, tokens=0):
+        """Count processed items and tokens, and show the progress every few seconds"""
+        self.items += items
+        self.tokens += tokens
+        now = time.perf_counter()
+        if now - self.last_report < self.run.interval:
+            return
+        self.last_report = now
+        seconds = now - self.start
+        message = '{}: {}'.format(self.name, self.describe(seconds))
+        record = self.record(seconds)
+        record['event'] = 'progress'
+        if self.total and self.items:
+            eta = seconds * (self.total - self.items) / self.items
+            message += ', ETA {}'.format(format_duration(eta))
+            record['eta_seconds'] = eta
+        print(message, file=self.run.output)
+        self.run.write(record)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# This module evaluates the predictions of the classifier. The predictions of all folds are kept in
+# preallocated arrays, and the confusion matrices and per-class scores of all folds (or subsets of a
+# test set) are computed at once. The results can be written as CSV and JSON, and the F1-scores as
+# plain score files (one number per line) that the scripts in the R folder read with scan().
+
+import csv
+import json
+import numpy
+
+
+class Predictions:
+    """The true and predicted labels of all documents, and the group (e.g. fold) every document belongs to"""
+
+    def __init__(self, y):
+        self.y = numpy.asarray(y)
+        self.predicted = numpy.full(len(self.y), -1, dtype=numpy.int64)
+        self.groups = numpy.full(len(self.y), -1, dtype=numpy.int64)
+
+    def add(self, group, indices, predicted):
+        """Store the predicted labels of the documents with the given indices"""
+        self.predicted[indices] = predicted
+        self.groups[indices] = group
+
+
+def confusion_matrices(y, predicted, groups, n_groups, n_classes):
+    """
+    Compute the confusion matrix of every group at once. Returns an array of shape
+    (n_groups, n_classes, n_classes), in which [g, i, j] is the number of documents of group g
+    with label i that were classified as j. Documents with a negative group are left out.
+    """
+    y, predicted, groups = numpy.asarray(y), numpy.asarray(predicted), numpy.asarray(groups)
+    keep = groups >= 0
+    cells = (groups[keep] * n_classes + y[keep]) * n_classes + predicted[keep]
+    counts = numpy.bincount(cells, minlength=n_groups * n_classes * n_classes)
+    return counts.reshape(n_groups, n_classes, n_classes)
+
+
+def divide(numerator, denominator):
+    # Scores with a zero denominator are 0, like scikit-learn does
+    return numpy.divide(numerator, denominator, out=numpy.zeros(numerator.shape), where=denominator > 0)
+
+
+def scores(matrices):
+    """
+    Compute the scores of every confusion matrix (see confusion_matrices). Returns a dict of arrays:
+    the per-class scores (precision, recall, f1 and support) have a row for every group, and the
+    averages (accuracy, macro_precision, macro_recall, macro_f1, weighted_f1) have a value for every group.
+    """
+    matrices = numpy.asarray(matrices)
+    correct = numpy.diagonal(matrices, axis1=1, axis2=2).astype(float)
+    support = matrices.sum(axis=2)
+    predicted = matrices.sum(axis=1)
+    precision = divide(correct, predicted)
+    recall = divide(correct, support)
+    f1 = divide(2 * precision * recall, precision + recall)
+    total = support.sum(axis=1)
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'support': support,
+        'accuracy': divide(correct.sum(axis=1), total),
+        'macro_precision': precision.mean(axis=1),
+        'macro_recall': recall.mean(axis=1),
+        'macro_f1': f1.mean(axis=1),
+        # The average that the thesis reports (the 'avg / total' row of classification_report)
+        'weighted_f1': divide((f1 * support).sum(axis=1), total),
+    }
+
+
+def evaluate(y, predicted, groups, n_groups, n_classes):
+    """Return the confusion matrices and the scores of all groups"""
+    matrices = confusion_matrices(y, predicted, groups, n_groups, n_classes)
+    return matrices, scores(matrices)
+
+
+def stratified_subsets(y, n_subsets, seed=0):
+    """
+    Divide documents into non-overlapping subsets, with the labels spread evenly over the subsets.
+    Returns the subset of every document.
+    """
+    y = numpy.asarray(y)
+    random = numpy.random.RandomState(seed)
+    groups = numpy.empty(len(y), dtype=numpy.int64)
+    # The documents of every label are shuffled, and dealt to the subsets in turn. Every label
+    # starts at the subset where the previous label stopped, so the subsets have (almost) equal sizes.
+    start = 0
+    for label in numpy.unique(y):
+        indices = numpy.flatnonzero(y == label)
+        random.shuffle(indices)
+        groups[indices] = (start + numpy.arange(len(indices))) % n_subsets
+        start = (start + len(indices)) % n_subsets
+    return groups
+
+
+def bootstrap(y, predicted, n_samples, n_classes, seed=0):
+    """
+    Draw bootstrap samples (documents drawn with replacement) of a test set, and return the confusion
+    matrices of all samples. The classifier is not refitted, only its predictions are resampled.
+    """
+    y, predicted = numpy.asarray(y), numpy.asarray(predicted)
+    random = numpy.random.RandomState(seed)
+    samples = random.randint(0, len(y), size=(n_samples, len(y)))
+    groups = numpy.repeat(numpy.arange(n_samples), len(y))
+    return confusion_matrices(y[samples].ravel(), predicted[samples].ravel(), groups, n_samples, n_classes)
+
+
+def print_confusion_matrix(classes, matrix):
+    """Print a confusion matrix to the standard output"""
+    print('\t' + '\t'.join(classes))
+    for i, line in enumerate(matrix):
+        print(classes[i], end='\t')
+        print('\t'.join(str(j) for j in line))
+
+
+def format_report(result, group, classes):
+    """Format the scores of a group as a table, like classification_report does"""
+    width = max(len(name) for name in list(classes) + ['weighted avg'])
+    line = '{:>{width}} {:>9} {:>9} {:>9} {:>9}\n'
+    row = '{:>{width}} {:>9.2f} {:>9.2f} {:>9.2f} {:>9}\n'
+    total = result['support'][group].sum()
+    report = line.format('', 'precision', 'recall', 'f1-score', 'support', width=width) + '\n'
+    for i, name in enumerate(classes):
+        report += row.format(name, result['precision'][group, i], result['recall'][group, i],
+                             result['f1'][group, i], result['support'][group, i], width=width)
+    report += '\n' + '{:>{width}} {:>9} {:>9} {:>9.2f} {:>9}\n'.format('accuracy', '', '', result['accuracy'][group],
+                                                                       total, width=width)
+    report += row.format('macro avg', result['macro_precision'][group], result['macro_recall'][group],
+                         result['macro_f1'][group], total, width=width)
+    weighted = [(result[name][group] * result['support'][group]).sum() / max(total, 1)
+                for name in ['precision', 'recall']]
+    report += row.format('weighted avg', weighted[0], weighted[1], result['weighted_f1'][group], total, width=width)
+    return report
+
+
+def print_results(matrices, result, group, classes):
+    """Print the confusion matrix and the scores of a group"""
+    print_confusion_matrix(list(classes), matrices[group])
+    print()
+    print(format_report(result, group, classes))
+
+
+AVERAGES = ['accuracy', 'macro_precision', 'macro_recall', 'macro_f1', 'weighted_f1']
+PER_CLASS = ['precision', 'recall', 'f1', 'support']
+
+
+def write_csv(filename, result, classes, names):
+    """Write the scores of all groups to a CSV file, with a row for every group (named by names)"""
+    with open(filename, 'w', newline='') as file_handle:
+        writer = csv.writer(file_handle)
+        writer.writerow(['group'] + AVERAGES + ['{}_{}'.format(name, label) for label in classes for name in PER_CLASS])
+        for group, group_name in enumerate(names):
+            writer.writerow([group_name] + ['{:.6f}'.format(result[name][group]) for name in AVERAGES] +
+                            [result[name][group, i] if name == 'support' else '{:.6f}'.format(result[name][group, i])
+                             for i in range(len(classes)) for name in PER_CLASS])
+
+
+def write_json(filename, matrices, result, classes, names):
+    """Write the confusion matrices and scores of all groups to a JSON file"""
+    groups = []
+    for group, group_name in enumerate(names):
+        groups.append(dict(
+            [('name', group_name), ('confusion_matrix', matrices[group].tolist())] +
+            [(name, float(result[name][group])) for name in AVERAGES] +
+            [(name, dict(zip(classes, result[name][group].tolist()))) for name in PER_CLASS]))
+    with open(filename, 'w') as file_handle:
+        json.dump({'classes': list(classes), 'groups': groups}, file_handle, indent=1)
+
+
+def write_scores(filename, values):
+    """Write one score per line, so it can be read with scan() in R (see R/t-tests.R)"""
+    with open(filename, 'w') as file_handle:
+        file_handle.write(''.join('{:.6f}\n'.format(value) for value in values))
+
+
+def write_results(prefix, matrices, result, classes, names, score):
+    """Write the CSV, JSON and score files of the results of all groups (<PREFIX>.csv, .json and .txt)"""
+    write_csv(prefix + '.csv', result, classes, names)
+    write_json(prefix + '.json', matrices, result, classes, names)
+    write_scores(prefix + '.txt', result[score])
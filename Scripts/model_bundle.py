@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# This module saves a trained classifier pipeline (TF-IDF weighting and linear SVM) to a single
+# file, and applies it to new documents. Only the numbers that are needed to classify documents
+# are stored: the columns of the hashed n-gram features that were used, their IDF weights, and the
+# coefficients and intercepts of the SVM. Classifying documents only requires numpy.
+# Long documents (e.g. books) can be classified in windows of a fixed number of tags, so they never
+# have to be in memory as a whole, and the classification can stop once the windows agree enough.
+
+import json
+import numpy
+from itertools import islice
+import ngram_features
+
+
+def save(path, pipeline, columns, classes, features, extension, ngram_range, n_features):
+    """
+    Save a fitted pipeline. columns are the (sorted) hashed n-gram columns that the pipeline was
+    trained on, and classes are the names of the labels.
+    """
+    settings = {'features': features, 'extension': extension, 'ngram_range': list(ngram_range),
+                'n_features': n_features}
+    with open(path, 'wb') as file_handle:
+        numpy.savez(file_handle,
+                    columns=numpy.asarray(columns, dtype=numpy.int64),
+                    idf=pipeline.named_steps['transformer'].idf_.astype(numpy.float32),
+                    coef=pipeline.named_steps['clf'].coef_.astype(numpy.float32),
+                    intercept=pipeline.named_steps['clf'].intercept_.astype(numpy.float32),
+                    classes=numpy.asarray(classes, dtype=str),
+                    settings=numpy.array(json.dumps(settings)))
+
+
+def split_windows(tags, size):
+    """Split an iterable of tags into lists of size tags (the last window can be shorter)"""
+    tags = iter(tags)
+    while True:
+        window = list(islice(tags, size))
+        if not window:
+            return
+        yield window
+
+
+def margins(scores):
+    """Return the difference between the highest and the second highest score of every row"""
+    if scores.shape[1] == 1:
+        return numpy.abs(scores[:, 0])
+    highest = numpy.partition(scores, -2, axis=1)
+    return highest[:, -1] - highest[:, -2]
+
+
+class Model:
+    """A classifier that was saved with save"""
+
+    def __init__(self, path):
+        with numpy.load(path, allow_pickle=False) as bundle:
+            self.columns = bundle['columns']
+            self.idf = bundle['idf']
+            # Store the coefficients per feature, so the coefficients of a document's features are contiguous
+            self.coef = numpy.ascontiguousarray(bundle['coef'].T)
+            self.intercept = bundle['intercept']
+            self.classes = list(bundle['classes'])
+            settings = json.loads(str(bundle['settings']))
+        self.features = settings['features']
+        self.extension = settings['extension']
+        self.ngram_range = tuple(settings['ngram_range'])
+        self.n_features = settings['n_features']
+
+    def feature_indices(self, tags):
+        """Return the indices of the model's features that occur in a list of tags"""
+        hashed = ngram_features.document_columns(tags, self.ngram_range, self.n_features)
+        indices = numpy.searchsorted(self.columns, hashed)
+        indices[indices == len(self.columns)] = 0
+        return indices[self.columns[indices] == hashed]
+
+    def decision_scores(self, documents):
+        """
+        Return the decision scores of a batch of documents (lists of tags), with a row per document and
+        a column per class. This is the same as decision_function of the pipeline, computed as a single
+        sparse product for the whole batch.
+        """
+        indices = [self.feature_indices(tags) for tags in documents]
+        rows = numpy.repeat(numpy.arange(len(indices)), [len(i) for i in indices])
+        indices = numpy.concatenate(indices) if indices else numpy.empty(0, dtype=numpy.int64)
+        # The features are binary, so their TF-IDF values are their IDF weights, normalized per document
+        values = self.idf[indices].astype(numpy.float64)
+        norms = numpy.sqrt(numpy.bincount(rows, weights=values ** 2, minlength=len(documents)))
+        values /= norms[rows]
+        scores = numpy.empty((len(documents), self.coef.shape[1]))
+        for i in range(self.coef.shape[1]):
+            scores[:, i] = numpy.bincount(rows, weights=self.coef[indices, i] * values, minlength=len(documents))
+        return scores + self.intercept
+
+    def predict(self, scores):
+        """Return the predicted class for every row of decision scores"""
+        if scores.shape[1] == 1:
+            return [self.classes[int(score > 0)] for score in scores[:, 0]]
+        return [self.classes[i] for i in numpy.argmax(scores, axis=1)]
+
+    def classify_windows(self, windows, batch_size=64, aggregate='mean', stop_margin=None, min_windows=1):
+        """
+        Classify a document that is split into windows (lists of tags, see split_windows). The windows are
+        classified in batches, and their decision scores are combined by taking their mean, or (with
+        aggregate='vote') the share of the windows that were assigned to every class. When stop_margin is
+        given, the remaining windows are skipped as soon as the combined score of the best class exceeds
+        that of the second best by this margin (after at least min_windows windows).
+        Returns the decision scores of the windows that were classified, and the combined scores.
+        """
+        windows = iter(windows)
+        width = self.coef.shape[1] if aggregate == 'mean' else len(self.classes)
+        total = numpy.zeros(width)
+        count = 0
+        window_scores = []
+        while True:
+            batch = list(islice(windows, batch_size))
+            if not batch:
+                break
+            scores = self.decision_scores(batch)
+            if aggregate == 'mean':
+                values = scores
+            else:
+                values = numpy.zeros((len(batch), width))
+                values[numpy.arange(len(batch)), [self.classes.index(label) for label in self.predict(scores)]] = 1
+            # The combined scores after every window of the batch
+            counts = count + numpy.arange(1, len(batch) + 1)
+            cumulative = total + numpy.cumsum(values, axis=0)
+            end = len(batch)
+            stopped = False
+            if stop_margin is not None:
+                confident = numpy.flatnonzero((margins(cumulative / counts[:, numpy.newaxis]) >= stop_margin) &
+                                              (counts >= min_windows))
+                if len(confident):
+                    end = confident[0] + 1
+                    stopped = True
+            window_scores.append(scores[:end])
+            total = cumulative[end - 1]
+            count = counts[end - 1]
+            if stopped:
+                break
+        if not window_scores:
+            return numpy.empty((0, self.coef.shape[1])), total
+        return numpy.concatenate(window_scores), total / count
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# This module converts documents (files with tokens or tags separated by whitespace) into binary
+# n-gram features. Instead of building a vocabulary of n-gram strings, every tag is mapped to an
+# integer once, and the n-grams of a document are hashed arithmetically with numpy. Every n-gram
+# size has its own block of columns in the resulting matrix, so n-grams of different sizes never
+# collide. The hashing does not depend on the data, so documents can be transformed independently.
+
+import numpy
+import zlib
+
+# The number of columns for every n-gram size (classify_sk uses the same number by default)
+N_FEATURES = 2 ** 22
+# The multiplier of the rolling hash (the 64-bit FNV prime)
+MULTIPLIER = numpy.uint64(1099511628211)
+
+tag_ids = dict()
+
+
+def split_tags(text):
+    """Return the list of (lowercased) tokens or tags in a text. All documents are split this way."""
+    return text.lower().split()
+
+
+def read_tags(filename):
+    """Return the list of (lowercased) tokens or tags in a file"""
+    with open(filename, 'r') as file_handle:
+        return split_tags(file_handle.read())
+
+
+def iter_tags(filename):
+    """Yield the (lowercased) tokens or tags of a file one by one, without reading the whole file at once"""
+    with open(filename, 'r') as file_handle:
+        for line in file_handle:
+            yield from split_tags(line)
+
+
+def encode(tags):
+    """Convert a list of tags to an array of integers. The integer of a tag is the same in every process."""
+    ids = numpy.empty(len(tags), dtype=numpy.uint64)
+    for i, tag in enumerate(tags):
+        if tag not in tag_ids:
+            tag_ids[tag] = zlib.crc32(tag.encode('utf-8'))
+        ids[i] = tag_ids[tag]
+    return ids
+
+
+def ngram_columns(ids, n, n_features=N_FEATURES):
+    """Return the column (within the block of its size) of every n-gram in an encoded document"""
+    count = len(ids) - (n - 1)
+    if count <= 0:
+        return numpy.empty(0, dtype=numpy.int64)
+    keys = ids[:count] + numpy.uint64(n)
+    for i in range(1, n):
+        keys = keys * MULTIPLIER + ids[i:i + count]
+    # Mix the bits, so the lower bits depend on all tags
+    keys ^= keys >> numpy.uint64(33)
+    keys *= numpy.uint64(0xff51afd7ed558ccd)
+    keys ^= keys >> numpy.uint64(33)
+    return (keys % numpy.uint64(n_features)).astype(numpy.int64)
+
+
+def encoded_columns(ids, ngram_range, n_features=N_FEATURES):
+    """Return the sorted columns of all n-grams in an encoded document"""
+    minimum, maximum = ngram_range
+    columns = [ngram_columns(ids, n, n_features) + (n - minimum) * n_features for n in range(minimum, maximum + 1)]
+    return numpy.unique(numpy.concatenate(columns))
+
+
+def document_columns(tags, ngram_range, n_features=N_FEATURES):
+    """Return the sorted columns of all n-grams in a list of tags"""
+    return encoded_columns(encode(tags), ngram_range, n_features)
+
+
+def transform_encoded(documents, ngram_range, n_features=N_FEATURES):
+    """Convert encoded documents (arrays of tag integers) into a binary CSR matrix with a column for every n-gram"""
+    # scipy is only needed for training, classifying documents (see model_bundle) only requires numpy
+    from scipy import sparse
+    indptr = [0]
+    indices = []
+    for ids in documents:
+        columns = encoded_columns(ids, ngram_range, n_features)
+        indices.append(columns)
+        indptr.append(indptr[-1] + len(columns))
+    indices = numpy.concatenate(indices) if indices else numpy.empty(0, dtype=numpy.int64)
+    width = (ngram_range[1] - ngram_range[0] + 1) * n_features
+    return sparse.csr_matrix((numpy.ones(len(indices), dtype=numpy.uint8), indices, indptr),
+                             shape=(len(indptr) - 1, width))
+
+
+def transform(filenames, ngram_range, n_features=N_FEATURES):
+    """Convert the files into a binary CSR matrix with a column for every (hashed) n-gram"""
+    return transform_encoded((encode(read_tags(filename)) for filename in filenames), ngram_range, n_features)
+
+
+class FeatureNames:
+    """
+    The n-grams that belong to the columns of a (column-selected) feature matrix.
+    Only the n-grams that are actually asked for are decoded, by finding them in the first document
+    that contains them, so no vocabulary has to be kept in memory.
+    """
+
+    def __init__(self, matrix, filenames, columns, ngram_range, n_features=N_FEATURES, read=read_tags):
+        self.matrix = matrix
+        self.filenames = filenames
+        self.columns = columns
+        self.ngram_range = ngram_range
+        self.n_features = n_features
+        # The function that returns the tags of a document, given its name
+        self.read = read
+        self.first_documents = None
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, i):
+        if self.first_documents is None:
+            matrix = self.matrix.tocsc()
+            self.first_documents = matrix.indices[matrix.indptr[:-1]]
+        column = self.columns[i]
+        n = self.ngram_range[0] + column // self.n_features
+        tags = self.read(self.filenames[self.first_documents[i]])
+        start = numpy.flatnonzero(ngram_columns(encode(tags), n, self.n_features) == column % self.n_features)[0]
+        return ascii(tuple(tags[start:start + n]))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# This module stores all documents of a language (with one type of features) in a packed form,
+# instead of as thousands of small files. The packed form of a directory (e.g. DE/*.pos) consists of:
+#   .packed/DE.pos.ids      the (lowercased) tags of all documents, as one contiguous array of uint32 tag IDs
+#   .packed/DE.pos.offsets  an int64 array with the position of the first tag of every document (and the end)
+#   .packed/DE.pos.json     the tags that belong to the tag IDs, the names of the documents, and the size and
+#                           modification time of the files they were packed from
+# The arrays are read with numpy.memmap, so loading a corpus only maps a few files, and the tags of a
+# document are a slice of the mapped array. A packed form is only used while the files it was packed from
+# are unchanged: when documents are retagged, added or removed, the files are read again until it is repacked.
+#
+# Run this module as a script to pack the documents of a dataset, e.g. packed_corpus.py <PATH> -e .pos
+
+import argparse
+import glob
+import json
+import numpy
+import os
+import zlib
+import instrumentation
+import ngram_features
+
+DIRECTORY = '.packed'
+
+
+def prefix(path, language, extension):
+    return os.path.join(path, DIRECTORY, language + extension)
+
+
+def sources(filenames):
+    """Return the name, size and modification time of every file, which identify the files a pack was made of"""
+    result = []
+    for filename in filenames:
+        stat = os.stat(filename)
+        result.append([os.path.basename(filename), stat.st_size, stat.st_mtime_ns])
+    return result
+
+
+def pack(path, language, extension):
+    """Pack all documents with the given extension in the folder of a language. Returns the number of documents."""
+    filenames = sorted(glob.glob('{}/{}/*{}'.format(path, language, extension)))
+    os.makedirs(os.path.join(path, DIRECTORY), exist_ok=True)
+    base = prefix(path, language, extension)
+    tag_ids = dict()
+    offsets = [0]
+    # The tags are written document by document, so the whole corpus never has to be in memory
+    with open(base + '.ids.tmp', 'wb') as file_handle:
+        for filename in filenames:
+            ids = [tag_ids.setdefault(tag, len(tag_ids)) for tag in ngram_features.read_tags(filename)]
+            numpy.array(ids, dtype=numpy.uint32).tofile(file_handle)
+            offsets.append(offsets[-1] + len(ids))
+    numpy.array(offsets, dtype=numpy.int64).tofile(base + '.offsets.tmp')
+    os.replace(base + '.ids.tmp', base + '.ids')
+    os.replace(base + '.offsets.tmp', base + '.offsets')
+    # The metadata is written last, as its presence denotes that the packed corpus is complete
+    metadata = {'tags': sorted(tag_ids, key=tag_ids.get), 'names': [os.path.basename(name) for name in filenames],
+                'sources': sources(filenames)}
+    with open(base + '.json.tmp', 'w') as file_handle:
+        json.dump(metadata, file_handle)
+    os.replace(base + '.json.tmp', base + '.json')
+    return len(filenames)
+
+
+def is_up_to_date(path, language, extension):
+    """Return whether a language is packed, and its files have not changed since they were packed"""
+    base = prefix(path, language, extension)
+    if not os.path.exists(base + '.json'):
+        return False
+    with open(base + '.json', 'r') as file_handle:
+        packed_sources = json.load(file_handle).get('sources')
+    filenames = sorted(glob.glob('{}/{}/*{}'.format(path, language, extension)))
+    return packed_sources == sources(filenames)
+
+
+def is_packed(path, languages, extension):
+    """Return whether the documents of all languages are available in packed form, and up to date"""
+    return all(is_up_to_date(path, language, extension) for language in languages)
+
+
+def is_stale(path, languages, extension):
+    """Return whether a language was packed, but its files have changed since"""
+    return any(os.path.exists(prefix(path, language, extension) + '.json') and
+               not is_up_to_date(path, language, extension) for language in languages)
+
+
+def memmap(filename, dtype):
+    # numpy cannot map empty files
+    if os.path.getsize(filename) == 0:
+        return numpy.empty(0, dtype=dtype)
+    return numpy.memmap(filename, dtype=dtype, mode='r')
+
+
+class PackedLanguage:
+    """The packed documents of a single language"""
+
+    def __init__(self, path, language, extension):
+        base = prefix(path, language, extension)
+        with open(base + '.json', 'r') as file_handle:
+            metadata = json.load(file_handle)
+        self.files = [base + '.ids', base + '.offsets', base + '.json']
+        self.ids = memmap(base + '.ids', numpy.uint32)
+        self.offsets = memmap(base + '.offsets', numpy.int64)
+        self.tags = metadata['tags']
+        self.names = metadata['names']
+        # The integers of the tags, as ngram_features.encode would create them
+        self.encoding = numpy.array([zlib.crc32(tag.encode('utf-8')) for tag in self.tags], dtype=numpy.uint64)
+
+    def encoded(self, i):
+        """Return the encoded tags of a document (see ngram_features.encode)"""
+        return self.encoding[self.ids[self.offsets[i]:self.offsets[i + 1]]]
+
+    def read_tags(self, i):
+        """Return the list of tags of a document"""
+        return [self.tags[tag] for tag in self.ids[self.offsets[i]:self.offsets[i + 1]]]
+
+
+class PackedCorpus:
+    """
+    The packed documents of multiple languages of a dataset. A document is named like the file it was
+    packed from ('<PATH>/<LANGUAGE>/<FILE>'), so it can be used wherever the name of a file is expected.
+    """
+
+    def __init__(self, path, languages, extension):
+        self.path = path
+        self.languages = {language: PackedLanguage(path, language, extension) for language in languages}
+        self.documents = dict()
+        for language, packed in self.languages.items():
+            for i, name in enumerate(packed.names):
+                self.documents['{}/{}/{}'.format(path, language, name)] = (packed, i)
+
+    def files(self):
+        """Return the files of the packed corpus"""
+        return [filename for packed in self.languages.values() for filename in packed.files]
+
+    def names(self, language):
+        """Return the names of the documents of a language"""
+        return ['{}/{}/{}'.format(self.path, language, name) for name in self.languages[language].names]
+
+    def read_tags(self, name):
+        packed, i = self.documents[name]
+        return packed.read_tags(i)
+
+    def transform(self, names, ngram_range, n_features=ngram_features.N_FEATURES):
+        """Convert documents into a binary CSR matrix, like ngram_features.transform"""
+        encoded = (packed.encoded(i) for packed, i in map(self.documents.get, names))
+        return ngram_features.transform_encoded(encoded, ngram_range, n_features)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', type=str, help='The location of the dataset (with a folder for every language)')
+    parser.add_argument('-e', '--extension', action='append',
+                        help='The extension of the documents to pack (can be given multiple times, '
+                             'default: .pos and .uni)')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    run = instrumentation.start('packed_corpus', args)
+    if args.path[-1] == '/':
+        args.path = args.path[:-1]
+    languages = sorted(language for language in os.listdir(args.path)
+                       if os.path.isdir(os.path.join(args.path, language)) and language[0] != '.')
+    extensions = args.extension or ['.pos', '.uni']
+    with run.stage('pack', total=len(languages) * len(extensions), unit='languages') as stage:
+        for extension in extensions:
+            for language in languages:
+                count = pack(args.path, language, extension)
+                print('Packed {} {} documents of {}'.format(count, extension, language))
+                stage.update()
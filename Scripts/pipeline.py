@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+# This script runs all steps that are needed to go from the raw corpora to a cross-validated
+# (and evaluated) classifier, instead of running every script by hand:
+#
+#   find_fragments -> split_data -> select_files -> convert_to_pos -> classify_sk
+#                                           test set -> convert_to_pos ---^
+#                                 (or) Books dataset -> book_to_txt ------^
+#
+# Every step declares the files it reads. A step is only run when its inputs changed since it last
+# succeeded, when its command changed, or when a step it depends on was run. Steps that do not depend
+# on each other (e.g. tagging the training set and the test set) are run at the same time, and the CPUs
+# (--cpus) are divided between them.
+# The steps keep communicating through their files, as most of them keep their own caches
+# (see fragment_index, preprocess_cache and feature_cache), so a rerun only processes what changed.
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import instrumentation
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+EXTENSIONS = {'tokens': '.txt', 'POS': '.pos', 'POS-universal': '.uni'}
+# The languages that classify_sk is trained on, so only their speeches are extracted and selected
+LANGUAGES = ['DE', 'EN', 'ES', 'FR', 'IT', 'NL']
+
+
+class Step:
+    """
+    A step of the pipeline: a script with its arguments, the files it reads and writes (glob patterns),
+    and the steps it depends on. parallel is whether the script takes the number of processes to use (-j).
+    """
+
+    def __init__(self, name, script, arguments, inputs, outputs, dependencies=(), parallel=True):
+        self.name = name
+        self.command = [sys.executable, os.path.join(SCRIPTS, script)] + arguments
+        self.inputs = inputs
+        self.outputs = outputs
+        self.dependencies = list(dependencies)
+        self.parallel = parallel
+
+    def stamp(self):
+        return os.path.join(args.work, '.pipeline', self.name)
+
+    def newest_input(self):
+        """Return the modification time of the newest input file"""
+        newest = 0
+        for pattern in self.inputs:
+            for path in glob.iglob(pattern):
+                newest = max(newest, os.stat(path).st_mtime)
+        return newest
+
+    def reason(self, ran):
+        """Return why the step has to run, or None if it is up to date. ran are the steps that have run."""
+        if args.force:
+            return 'forced'
+        if not os.path.exists(self.stamp()):
+            return 'never run'
+        with open(self.stamp(), 'r') as file_handle:
+            if file_handle.read() != ' '.join(self.command):
+                return 'command changed'
+        for dependency in self.dependencies:
+            if dependency in ran:
+                return '{} was run'.format(dependency)
+        if any(not glob.glob(pattern) for pattern in self.outputs):
+            return 'outputs missing'
+        if self.newest_input() > os.stat(self.stamp()).st_mtime:
+            return 'inputs changed'
+        return None
+
+    def run(self, processes):
+        """
+        Run the step with the given number of processes, and write its output to a log file.
+        Returns whether it succeeded.
+        """
+        # The number of processes does not change the results, so it is not part of the stamped command
+        command = self.command + (['-j', str(processes)] if self.parallel else [])
+        command += ['--metrics', args.metrics] if args.metrics else []
+        with open(os.path.join(args.work, 'logs', self.name + '.log'), 'w') as log:
+            code = subprocess.call(command, cwd=args.work, stdout=log, stderr=subprocess.STDOUT)
+        if code == 0:
+            with open(self.stamp(), 'w') as file_handle:
+                file_handle.write(' '.join(self.command))
+        return code == 0
+
+
+def create_steps():
+    """Declare the steps of the pipeline"""
+    fragments = os.path.join(args.work, 'fragment_data')
+    selected = os.path.join(args.work, 'selected')
+    extension = EXTENSIONS[args.features]
+    tagsets = ['-f', args.features] if args.features != 'tokens' else []
+    steps = [
+        Step('find_fragments', 'find_fragments.py', [args.europarl, args.meps, '-i', fragments + '/fragments.db'],
+             [args.europarl + '/*/*.xml.gz', args.meps], [fragments + '/fragments.db']),
+        Step('split_data', 'split_data.py', [args.europarl, fragments, '-l'] + LANGUAGES,
+             [fragments + '/fragments.db'], [fragments + '/*/*.txt'], ['find_fragments']),
+        Step('select_files', 'select_files.py', [fragments, selected, '-l'] + LANGUAGES,
+             [fragments + '/*/*.txt', fragments + '/tokens.tsv'], [selected + '/*/*.txt'], ['split_data'],
+             parallel=False),
+    ]
+    train_dependencies = ['select_files']
+    if args.features != 'tokens':
+        steps.append(Step('tag_train', 'convert_to_pos.py', [selected] + tagsets,
+                          [selected + '/*/*.txt'], [selected + '/*/*' + extension], ['select_files']))
+        train_dependencies = ['tag_train']
+    classify = ['cv', '-f', args.features] + (['--balance'] if args.balance else [])
+    test = args.test
+    if args.books:
+        # The books are extracted into a folder per language, and tagged, in a single step
+        test = os.path.join(args.work, 'books')
+        steps.append(Step('book_to_txt', 'book_to_txt.py',
+                          [args.books, test, '-l', args.book_languages, '--skip-unknown'] + tagsets,
+                          [args.books + '/raw/en/*.xml.gz', args.book_languages], [test + '/*/*' + extension]))
+        train_dependencies.append('book_to_txt')
+    elif test and args.features != 'tokens':
+        steps.append(Step('tag_test', 'convert_to_pos.py', [test] + tagsets,
+                          [test + '/*/*.txt'], [test + '/*/*' + extension]))
+        train_dependencies.append('tag_test')
+    if test:
+        classify += ['-e', test]
+    inputs = [selected + '/*/*' + extension] + ([test + '/*/*' + extension] if test else [])
+    steps.append(Step('classify', 'classify_sk.py', classify + [selected], inputs, [], train_dependencies))
+    return {step.name: step for step in steps}
+
+
+def required_steps(steps, target):
+    """Return the names of the target step and all steps it depends on"""
+    required = {target}
+    for dependency in steps[target].dependencies:
+        required |= required_steps(steps, dependency)
+    return required
+
+
+def main():
+    os.makedirs(os.path.join(args.work, '.pipeline'), exist_ok=True)
+    os.makedirs(os.path.join(args.work, 'logs'), exist_ok=True)
+    steps = create_steps()
+    if args.target not in steps:
+        sys.exit('Unknown step {}, choose from: {}'.format(args.target, ', '.join(steps)))
+    pending = [name for name in steps if name in required_steps(steps, args.target)]
+    done = set()
+    ran = set()
+    failed = set()
+    running = dict()
+    # Every branch of the pipeline starts at a step without dependencies, so at most that many steps run at
+    # the same time. The CPUs are divided between them, instead of every step starting a process per CPU.
+    branches = sum(1 for name in pending if not steps[name].dependencies)
+    processes = max(1, args.cpus // min(args.jobs, branches))
+    # A step is started as soon as all its dependencies have finished, so independent steps run concurrently
+    with run.stage('steps', total=len(pending), unit='steps') as stage, ThreadPoolExecutor(args.jobs) as executor:
+        while pending or running:
+            for name in list(pending):
+                step = steps[name]
+                if any(dependency in failed for dependency in step.dependencies):
+                    print('{}: skipped, because a step it depends on failed'.format(name))
+                    pending.remove(name)
+                    failed.add(name)
+                    stage.update()
+                elif all(dependency in done for dependency in step.dependencies):
+                    pending.remove(name)
+                    reason = step.reason(ran)
+                    if reason is None:
+                        print('{}: up to date'.format(name))
+                        done.add(name)
+                        stage.update()
+                    elif args.dry_run:
+                        print('{}: would run ({})'.format(name, reason))
+                        done.add(name)
+                        ran.add(name)
+                        stage.update()
+                    else:
+                        print('{}: running ({})'.format(name, reason))
+                        running[executor.submit(step.run, processes)] = (name, time.time())
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, start = running.pop(future)
+                stage.update()
+                if future.result():
+                    print('{}: finished in {:.0f} seconds'.format(name, time.time() - start))
+                    done.add(name)
+                    ran.add(name)
+                else:
+                    print('{}: failed, see {}'.format(name, os.path.join(args.work, 'logs', name + '.log')))
+                    failed.add(name)
+    if failed:
+        sys.exit(1)
+    if 'classify' in ran and not args.dry_run:
+        print('The results of the classifier are in {}'.format(os.path.join(args.work, 'logs', 'classify.log')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('europarl', type=str, help='The path where the \'raw\' folder of Europarl can be found')
+    parser.add_argument('meps', type=str, help='The path where a list of MEPs can be found')
+    parser.add_argument('work', type=str, help='The location where all intermediate and final results are put')
+    parser.add_argument('-t', '--test', type=str, metavar='PATH',
+                        help='A test set (with a folder of text files for every language) to evaluate on')
+    parser.add_argument('--books', type=str, metavar='PATH',
+                        help='The Books dataset, to extract and tag as a test set (instead of --test)')
+    parser.add_argument('--book-languages', type=str, metavar='FILE',
+                        help='The file with the source language of every book (see book_to_txt.py)')
+    parser.add_argument('-f', '--features', default='POS', choices=['tokens', 'POS', 'POS-universal'],
+                        help='The type of features to use (default: %(default)s)')
+    parser.add_argument('-b', '--balance', action='store_true', help='Balance the training set')
+    parser.add_argument('--target', type=str, default='classify',
+                        help='Only run the steps that are needed for this step (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=2,
+                        help='The number of steps that may run at the same time (default: %(default)s)')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count(),
+                        help='The number of processes that all steps together may use; they are divided between '
+                             'the steps that run at the same time (default: the number of CPUs)')
+    parser.add_argument('--force', action='store_true', help='Run all steps, even if they are up to date')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='Only show which steps would run')
+    # --metrics is also passed to every step, so the measurements of all steps end up in the same file
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    if args.books and (args.test or not args.book_languages):
+        parser.error('--books requires --book-languages, and cannot be combined with --test')
+    # Use absolute paths, as the steps are run in the work directory
+    for name in ['europarl', 'meps', 'work', 'test', 'books', 'book_languages', 'metrics']:
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    run = instrumentation.start('pipeline', args)
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# This module keeps track of the preprocessed versions (POS-tags, parse rules) of text files,
+# so the preprocessing scripts can skip files that have not changed since they were last
+# processed. For every output file, the cache stores a hash of the contents of the text file
+# it was created from, and the tagger (and version) that was used to create it.
+# The cache is a SQLite database in the data directory.
+
+import hashlib
+import os
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outputs (
+    source TEXT,
+    extension TEXT,
+    hash TEXT,
+    tagger TEXT,
+    PRIMARY KEY (source, extension)
+);
+'''
+
+
+def connect(data_path):
+    """Open (and create if needed) the cache of the given data directory"""
+    connection = sqlite3.connect(os.path.join(data_path, '.preprocess_cache.db'))
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def lookup(connection, source):
+    """Return a dictionary that maps every cached output extension of a text file to its (hash, tagger)"""
+    rows = connection.execute('SELECT extension, hash, tagger FROM outputs WHERE source = ?', (source,))
+    return {extension: (digest, tagger) for extension, digest, tagger in rows}
+
+
+def store(connection, source, extension, digest, tagger):
+    """Record that the output with the given extension was created from the text file"""
+    connection.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)', (source, extension, digest, tagger))
+
+
+def file_hash(path):
+    """Return a hash of the contents of a file"""
+    with open(path, 'rb') as file_handle:
+        return hashlib.sha1(file_handle.read()).hexdigest()
+
+
+def is_up_to_date(cached, path, extension, digest, tagger):
+    """
+    Return whether the output of a text file with the given extension exists, and was created
+    from the current contents of the file with the same tagger.
+    cached should be the result of lookup for the text file.
+    """
+    return cached.get(extension) == (digest, tagger) and os.path.exists(path + extension)
+
+
+def write_output(path, text):
+    """
+    Write an output file. The file is first written under a temporary name, so an interrupted
+    run never leaves a partial output behind.
+    """
+    with open(path + '.tmp', 'w') as file_handle:
+        file_handle.write(text)
+    os.replace(path + '.tmp', path)
@@ -1,42 +1,95 @@
 #!/usr/bin/env python3
 
-# This script will copy files that have a length between 380 and 2500 tokens from
-# the input directory to the output directory.
+# This script will copy files that have a length between 380 and 2500 tokens (by default) from
+# the input directory to the output directory. The lengths are taken from the manifest that
+# split_data writes (see token_manifest), so the files only have to be read when there is no manifest.
+# The files are hard linked instead of copied when possible.
 
 import argparse
 import glob
-from nltk.tokenize import wordpunct_tokenize
-from os import makedirs, mkdir
+from os import link, makedirs, mkdir, remove
+from os.path import basename, dirname, exists
 from shutil import copyfile
+import fragment_index
+import instrumentation
+import token_manifest
 
 
-def process_data(language):
-    """Check the number of tokens for each .txt file in the dataset. Copy those that have between 380 and 2500 tokens
-    to the output directory. """
-    x = []
-    for path in glob.glob('{}{}/*.txt'.format(args.input, language)):
-        with open(path, 'r') as file_handle:
-            tokens = 0
-            for line in file_handle:
-                tokens += len(wordpunct_tokenize(line))
-            if 380 < tokens < 2500:
-                x.append(path)
-    for path in x:
-        copyfile(path, path.replace(args.input, args.output))
+def link_file(source, destination):
+    """
+    Hard link a file, or copy it if that is not possible (e.g. on another file system).
+    split_data replaces the files it writes instead of overwriting them, so a link is never changed afterwards.
+    """
+    if exists(destination):
+        remove(destination)
+    try:
+        link(source, destination)
+    except OSError:
+        copyfile(source, destination)
+
+
+def count_tokens(language, connection):
+    """Read and tokenize every .txt file of a language. Returns a (path, tokens) tuple for every file."""
+    # NLTK is only needed when there is no manifest
+    from nltk.tokenize import wordpunct_tokenize
+    if connection is not None:
+        # Only consider the speeches that are in the index
+        paths = ['{}{}/{}.{}.txt'.format(args.input, language, report_code, speaker_id)
+                 for report_code, speaker_id, _ in fragment_index.fragments(connection, [language])]
+        paths = [path for path in paths if exists(path)]
+    else:
+        paths = glob.glob('{}{}/*.txt'.format(args.input, language))
+    counts = []
+    with run.stage('count {}'.format(language), total=len(paths)) as stage:
+        for path in paths:
+            with open(path, 'r') as file_handle:
+                tokens = 0
+                for line in file_handle:
+                    tokens += len(wordpunct_tokenize(line))
+            counts.append((path, tokens))
+            stage.update(tokens=tokens)
+    return counts
+
+
+def process_data(language, connection, manifest):
+    """
+    Copy the .txt files of a language that have more than args.min_tokens and less than args.max_tokens tokens
+    to the output directory.
+    """
+    if manifest is not None:
+        counts = [(args.input + filename, tokens) for file_language, filename, tokens in manifest
+                  if file_language == language and exists(args.input + filename)]
+    else:
+        counts = count_tokens(language, connection)
+    x = [path for path, tokens in counts if args.min_tokens < tokens < args.max_tokens]
+    with run.stage('select {}'.format(language), total=len(x)) as stage:
+        for path in x:
+            link_file(path, path.replace(args.input, args.output))
+            stage.update()
 
 
 def main():
+    # Use the index created by find_fragments if it is available
+    connection = None
+    if exists('{}fragments.db'.format(args.input)):
+        connection = fragment_index.connect('{}fragments.db'.format(args.input))
+    # Use the token counts of split_data if they are available
+    manifest = token_manifest.read(args.input)
+    if manifest is None:
+        print('No {} found, counting the tokens of all files'.format(token_manifest.MANIFEST))
     try:
         makedirs(args.output, exist_ok=True)
     except FileExistsError:
         pass
-    for lang in ['DE', 'EN', 'ES', 'FR', 'IT', 'NL']:
+    # By default, every language that split_data extracted
+    languages = args.languages or sorted(basename(dirname(path)) for path in glob.glob(args.input + '*/'))
+    for lang in languages:
         try:
             mkdir(args.output + lang)
         except FileExistsError:
             pass
         print('Processing data for {}'.format(lang))
-        process_data(lang)
+        process_data(lang, connection, manifest)
 
 
 if __name__ == '__main__':
@@ -44,7 +97,15 @@ if __name__ == '__main__':
     parser.add_argument('input', type=str, help='The location of the full dataset')
     parser.add_argument('output', type=str,
                         help='The location where selected files should be placed. (Will be created when necessary)')
+    parser.add_argument('--min-tokens', type=int, default=380,
+                        help='Only select files with more tokens than this (default: %(default)s)')
+    parser.add_argument('--max-tokens', type=int, default=2500,
+                        help='Only select files with fewer tokens than this (default: %(default)s)')
+    parser.add_argument('-l', '--languages', nargs='+', metavar='LANGUAGE',
+                        help='Only select files of these languages (default: every language folder in the input)')
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
+    run = instrumentation.start('select_files', args)
     if args.input[-1] != '/':
         args.input += '/'
     if args.output[-1] != '/':
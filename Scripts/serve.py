@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+# This script runs a local HTTP server that classifies English texts by their source language,
+# using a classifier that was saved with 'classify_sk.py train'. The model is loaded once, and
+# documents from concurrent requests are combined into small batches, which are classified at once.
+#
+# POST /predict with a JSON object (or a list of objects) containing either "text" (raw English text,
+# which is tagged in the same way as convert_to_pos does, or split on whitespace like the training files
+# for a token based model) or "tags" (a string of tokens or tags separated by whitespace).
+# GET /stats returns latency and throughput counters. The tagger of a POS based model is loaded at startup.
+# With --metrics, the time of every batch is written as well (see instrumentation).
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import instrumentation
+import model_bundle
+import ngram_features
+
+
+class Batcher(threading.Thread):
+    """Collects documents from concurrent requests, and classifies them in batches"""
+
+    def __init__(self, model, batch_size, wait):
+        super().__init__(daemon=True)
+        self.model = model
+        self.batch_size = batch_size
+        self.wait = wait
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {'documents': 0, 'batches': 0, 'latency': 0.0, 'max_latency': 0.0}
+
+    def classify(self, documents):
+        """Classify a list of documents (lists of tags). Returns the predicted labels and decision scores."""
+        request = {'documents': documents, 'done': threading.Event(), 'time': time.time()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['labels'], request['scores']
+
+    def next_batch(self):
+        """Wait for a request, and add the requests that arrive shortly after it"""
+        batch = [self.requests.get()]
+        size = len(batch[0]['documents'])
+        deadline = time.time() + self.wait
+        while size < self.batch_size:
+            try:
+                request = self.requests.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request['documents'])
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            documents = [document for request in batch for document in request['documents']]
+            started = time.perf_counter()
+            try:
+                scores = self.model.decision_scores(documents)
+                labels = self.model.predict(scores)
+            except Exception as error:
+                # Report the error to the waiting requests, and keep serving
+                for request in batch:
+                    request['error'] = error
+                    request['done'].set()
+                continue
+            start = 0
+            for request in batch:
+                end = start + len(request['documents'])
+                request['labels'], request['scores'] = labels[start:end], scores[start:end]
+                start = end
+            finished = time.time()
+            run.write({'stage': 'classify', 'event': 'batch', 'items': len(documents), 'unit': 'documents',
+                       'seconds': time.perf_counter() - started})
+            with self.lock:
+                self.counters['documents'] += len(documents)
+                self.counters['batches'] += 1
+                for request in batch:
+                    latency = finished - request['time']
+                    self.counters['latency'] += latency
+                    self.counters['max_latency'] = max(self.counters['max_latency'], latency)
+            for request in batch:
+                request['done'].set()
+
+    def stats(self):
+        """Return the counters of the batcher"""
+        with self.lock:
+            counters = dict(self.counters)
+        uptime = time.time() - self.started
+        return {
+            'uptime': uptime,
+            'documents': counters['documents'],
+            'batches': counters['batches'],
+            'documents_per_second': counters['documents'] / uptime,
+            'mean_batch_size': counters['documents'] / max(1, counters['batches']),
+            'mean_latency_ms': 1000 * counters['latency'] / max(1, counters['documents']),
+            'max_latency_ms': 1000 * counters['max_latency'],
+        }
+
+
+def to_tags(document):
+    """Convert a request object to the list of tags that the classifier expects"""
+    if 'tags' in document:
+        return ngram_features.split_tags(document['tags'])
+    # A token based model is trained on the text files as they are, so the text is split like them
+    if args.model_features == 'tokens':
+        return ngram_features.split_tags(document['text'])
+    lines = document['text'].splitlines()
+    tagged_lines = convert_to_pos.tag_lines(lines, [args.model_features])[args.model_features]
+    return ngram_features.split_tags(' '.join(tagged_lines))
+
+
+class Server(ThreadingHTTPServer):
+    # Allow many clients to connect at the same time, so their documents can be batched
+    request_queue_size = 128
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.send_json(200, batcher.stats())
+        else:
+            self.send_json(404, {'error': 'Unknown path'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.send_json(404, {'error': 'Unknown path'})
+            return
+        try:
+            content = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            documents = content if isinstance(content, list) else [content]
+            tags = [to_tags(document) for document in documents]
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            self.send_json(400, {'error': 'Invalid request: {}'.format(error)})
+            return
+        except LookupError as error:
+            # NLTK raises a LookupError when data that the tagger needs is not installed
+            self.send_json(503, {'error': 'The tagger is not available: {}'.format(error)})
+            return
+        try:
+            labels, scores = batcher.classify(tags)
+        except Exception as error:
+            self.send_json(500, {'error': 'Classification failed: {}'.format(error)})
+            return
+        results = [{'language': label, 'scores': dict(zip(batcher.model.classes, map(float, row)))}
+                   for label, row in zip(labels, scores)]
+        self.send_json(200, results if isinstance(content, list) else results[0])
+
+    def log_message(self, format, *arguments):
+        if not args.quiet:
+            super().log_message(format, *arguments)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model', type=str, help='The file with the saved classifier')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='The address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8000, help='The port to listen on (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help='The maximum number of documents that are classified at once (default: %(default)s)')
+    parser.add_argument('--wait', type=float, default=5,
+                        help='The number of milliseconds to wait for more documents for a batch (default: %(default)s)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Do not log every request')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    run = instrumentation.start('serve', args)
+    with run.stage('load', total=1, unit='models') as stage:
+        model = model_bundle.Model(args.model)
+        args.model_features = model.features
+        if args.model_features != 'tokens':
+            # Load the tagger before serving, so a missing tagger model is reported now instead of on every request
+            import convert_to_pos
+            try:
+                convert_to_pos.load_tagger()
+            except LookupError as error:
+                sys.exit('The tagger that this model needs is not available:\n{}'.format(error))
+        stage.update()
+    batcher = Batcher(model, args.batch_size, args.wait / 1000)
+    batcher.start()
+    server = Server((args.host, args.port), RequestHandler)
+    print('Serving {} on http://{}:{}'.format(args.model, args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        # Stop quietly, so the profile and metrics are written
+        pass
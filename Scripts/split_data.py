@@ -1,47 +1,108 @@
 #!/usr/bin/env python3
 
 # This program will create text files from the raw xml files in Europarl.
-# It requires the files created by the find_fragments program.
+# It requires the files created by the find_fragments program. The speeches of every language that
+# find_fragments found are extracted, unless --languages is given.
 
-import glob
 import argparse
-import gzip
+import glob
 import os
-import xml.etree.ElementTree as ET
 from collections import defaultdict
+from multiprocessing import Pool
+from corpus_xml import iter_elements
+import fragment_index
+import instrumentation
+import preprocess_cache
+import token_manifest
+
+
+def extract_report(job):
+    """
+    Write the speeches of a single report to text files.
+    The report is streamed, and every speech is written to the folder of its language as soon as it is
+    found, so the report is decompressed and walked only once, no matter how many speeches it contains.
+    Returns a (language, file, tokens) tuple for every speech that was written.
+    """
+    path, metadata, report_code, speakers = job
+    written = []
+    for fragment in iter_elements('{}/en/{}.xml.gz'.format(path, report_code), 'SPEAKER'):
+        speaker_id = fragment.get('ID')
+        if speaker_id not in speakers:
+            continue
+        # Only the first speech with a given ID is used
+        language = speakers.pop(speaker_id)
+        text = ''.join('{}\n'.format(sentence.text) for sentence in fragment.iter('s'))
+        filename = '{}/{}.{}.txt'.format(language, report_code, speaker_id)
+        # The speech is replaced instead of overwritten, as select_files hard links the speeches it selects:
+        # a rerun must not change the files of a dataset that was already selected
+        preprocess_cache.write_output('{}/{}'.format(metadata, filename), text)
+        # Count the tokens now, so select_files does not have to read the speech again
+        written.append((language, filename, token_manifest.count_tokens(text)))
+        # Stop reading the report once all its speeches have been found
+        if not speakers:
+            break
+    return written
+
+
+def list_languages(metadata):
+    """Return the languages of which find_fragments wrote a list of speeches (<LANGUAGE>.txt)"""
+    return sorted(os.path.basename(filename)[:-len('.txt')] for filename in glob.glob('{}/*.txt'.format(metadata)))
 
 
 def main():
-    # Languages of interest
-    languages = ['EN', 'DE', 'FR', 'NL', 'IT', 'ES']
+    # Languages of interest (by default, every language that find_fragments found)
+    languages = args.languages
     report_id_language_dict = defaultdict(dict)
+    # Use the index created by find_fragments if it is available, or the lists of speeches otherwise
+    if os.path.exists('{}/fragments.db'.format(args.metadata)):
+        connection = fragment_index.connect('{}/fragments.db'.format(args.metadata))
+        for report_code, speaker_id, language in fragment_index.fragments(connection, languages):
+            report_id_language_dict[report_code][speaker_id] = language
+        connection.close()
+        if languages is None:
+            languages = sorted({language for speakers in report_id_language_dict.values()
+                                for language in speakers.values()})
+    else:
+        languages = languages or list_languages(args.metadata)
+        for language in languages:
+            with open('{}/{}.txt'.format(args.metadata, language)) as file_handle:
+                for line in file_handle:
+                    report_code, speaker_id = line.strip().split(',')
+                    report_id_language_dict[report_code][speaker_id] = language
+    print('Extracting the speeches of {} languages: {}'.format(len(languages), ', '.join(languages)))
     # Create a directory for each language of interest (when necessary)
     for language in languages:
         if not os.path.exists('{}/{}'.format(args.metadata, language)):
             os.mkdir('{}/{}'.format(args.metadata, language))
-        with open('{}/{}.txt'.format(args.metadata, language)) as file_handle:
-            for line in file_handle:
-                report_code, speaker_id = line.strip().split(',')
-                report_id_language_dict[report_code][speaker_id] = language
     # Read the gzipped xml files, and put every sentence spoken on a new line in a text file.
     # This will create one text file for every FileID,SpeakerID pair.
-    for report_code in report_id_language_dict:
-        with gzip.open('{}/en/{}.xml.gz'.format(args.path, report_code)) as file_handle:
-            tree = ET.fromstring(file_handle.read())
-            for speaker_id in report_id_language_dict[report_code]:
-                fragment = tree.find('.//SPEAKER[@ID=\'{}\']'.format(speaker_id))
-                with open('{}/{}/{}.{}.txt'.format(args.metadata,
-                                                   report_id_language_dict[report_code][speaker_id],
-                                                   report_code, speaker_id), 'w') as file_handle:
-                    for sentence in fragment.findall('.//s'):
-                        print(sentence.text, file=file_handle)
+    # The reports are spread over multiple processes.
+    # The number of tokens of every speech is stored in a manifest, which is used by select_files.
+    entries = []
+    with run.stage('extract', total=len(report_id_language_dict), unit='reports') as stage, Pool(args.jobs) as pool:
+        reports = ((args.path, args.metadata, report_code, speakers)
+                   for report_code, speakers in report_id_language_dict.items())
+        for written in pool.imap_unordered(extract_report, reports, chunksize=8):
+            entries += written
+            stage.update(tokens=sum(tokens for _, _, tokens in written))
+    # The speeches of other languages (extracted by an earlier run) are kept in the manifest
+    entries += [entry for entry in token_manifest.read(args.metadata) or [] if entry[0] not in languages]
+    token_manifest.write(args.metadata, entries)
+    print('All reports processed')
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('path', type=str, help='The path where the \'raw\' folder of Europarl can be found.')
     parser.add_argument('metadata', type=str, help='The path where the fragment_data folder can be found.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='The number of processes to use (default: the number of CPUs)')
+    parser.add_argument('-l', '--languages', nargs='+', metavar='LANGUAGE',
+                        help='Only extract the speeches of these languages, e.g. EN DE FR NL IT ES '
+                             '(default: every language that find_fragments found)')
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
+    run = instrumentation.start('split_data', args)
     # Remove the slash at the end of the path, if it is present
     if args.path[-1] == '/':
         args.path = args.path[:-1]
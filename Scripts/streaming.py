@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# This module trains and cross-validates a linear classifier on corpora that do not fit in memory.
+# Documents are read and transformed (with the stateless hashing in ngram_features) in chunks,
+# and a linear SVM is trained incrementally with stochastic gradient descent (hinge loss).
+# Every document is assigned to a fold by hashing its filename, so the folds do not depend on
+# the order or the number of documents. All folds are trained in the same pass over the data,
+# so every chunk is only read and transformed once per epoch.
+
+import numpy
+import os
+import zlib
+from scipy import sparse
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import normalize
+import ngram_features
+
+
+def assign_folds(filenames, n_folds):
+    """Return the fold of every file, based on a hash of its name"""
+    return numpy.array([zlib.crc32(os.path.basename(filename).encode('utf-8')) % n_folds
+                        for filename in filenames])
+
+
+def chunks(n, chunk_size, order=None):
+    """Yield arrays of document indices of at most chunk_size documents, optionally in the given order"""
+    if order is None:
+        order = numpy.arange(n)
+    for start in range(0, n, chunk_size):
+        yield order[start:start + chunk_size]
+
+
+def tfidf(x, df, n):
+    """
+    Apply TF-IDF weighting (as sklearn's TfidfTransformer does) to a binary matrix.
+    df contains the document frequency of the feature of every non-zero value of the matrix,
+    and n is the number of documents.
+    """
+    idf = numpy.log((1 + n) / (1 + df)) + 1
+    return normalize(sparse.csr_matrix((idf, x.indices, x.indptr), shape=x.shape))
+
+
+class StreamingCrossValidation:
+    """Trains a classifier for every fold in the same passes over the data"""
+
+    def __init__(self, filenames, y, classes, n_folds, ngram_range, n_features, chunk_size, alpha, seed=0,
+                 corpus=None):
+        self.filenames = filenames
+        # The documents are read from the packed corpus (see packed_corpus) if there is one
+        self.corpus = corpus
+        self.y = y
+        self.classes = numpy.arange(len(classes))
+        self.n_folds = n_folds
+        self.ngram_range = ngram_range
+        self.n_features = n_features
+        self.width = (ngram_range[1] - ngram_range[0] + 1) * n_features
+        self.chunk_size = chunk_size
+        self.random = numpy.random.RandomState(seed)
+        self.folds = assign_folds(filenames, n_folds)
+        self.models = []
+        for fold in range(n_folds):
+            # Weigh the classes inversely proportional to their frequencies in the training part,
+            # like class_weight='balanced' (which partial_fit does not support)
+            train_y = y[self.folds != fold]
+            counts = numpy.bincount(train_y, minlength=len(classes))
+            weights = {label: len(train_y) / (len(classes) * count) for label, count in enumerate(counts) if count}
+            self.models.append(SGDClassifier(loss='hinge', alpha=alpha, class_weight=weights, random_state=seed))
+        self.df = None
+
+    def transform(self, indices):
+        """Read and transform a chunk of documents"""
+        filenames = [self.filenames[i] for i in indices]
+        if self.corpus:
+            return self.corpus.transform(filenames, self.ngram_range, self.n_features)
+        return ngram_features.transform(filenames, self.ngram_range, self.n_features)
+
+    def count_documents(self):
+        """
+        Count the document frequency of every feature in every fold, so the training documents of a fold
+        can be weighed with the IDF values of its training part.
+        """
+        self.df = numpy.zeros((self.n_folds, self.width), dtype=numpy.int32)
+        for indices in chunks(len(self.filenames), self.chunk_size):
+            x = self.transform(indices)
+            for fold in range(self.n_folds):
+                rows = self.folds[indices] == fold
+                if rows.any():
+                    self.df[fold] += numpy.bincount(x[rows].indices, minlength=self.width).astype(numpy.int32)
+        self.total_df = self.df.sum(axis=0)
+
+    def train_tfidf(self, x, fold):
+        """Apply the TF-IDF weighting of the training part of a fold to a matrix"""
+        df = self.total_df[x.indices] - self.df[fold, x.indices]
+        return tfidf(x, df, numpy.sum(self.folds != fold))
+
+    def train_epoch(self):
+        """Update the classifiers of all folds with one (shuffled) pass over the data"""
+        order = self.random.permutation(len(self.filenames))
+        for indices in chunks(len(self.filenames), self.chunk_size, order):
+            x = self.transform(indices)
+            for fold, model in enumerate(self.models):
+                rows = self.folds[indices] != fold
+                if rows.any():
+                    model.partial_fit(self.train_tfidf(x[rows], fold), self.y[indices[rows]], classes=self.classes)
+
+    def predict(self):
+        """Classify every document with the classifier of its fold. Returns the predicted labels."""
+        predicted = numpy.empty(len(self.filenames), dtype=self.y.dtype)
+        for indices in chunks(len(self.filenames), self.chunk_size):
+            x = self.transform(indices)
+            for fold, model in enumerate(self.models):
+                rows = self.folds[indices] == fold
+                if rows.any():
+                    predicted[indices[rows]] = model.predict(self.train_tfidf(x[rows], fold))
+        return predicted
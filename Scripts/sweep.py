@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# This module compares configurations of the classifier (n-gram ranges, values of C, balanced or not)
+# without transforming the data for every configuration. The documents are transformed once with the
+# widest n-gram range; as every n-gram size has its own block of columns (see ngram_features), the
+# matrix of a narrower range is a slice of its columns. The document frequencies of the training part
+# of every fold are counted once, and the TF-IDF weights of every range are taken from them.
+
+import numpy
+
+
+def parse_ngram_range(text):
+    """Convert a range like '2-5' (or a single size like '3') to a (minimum, maximum) tuple"""
+    minimum, _, maximum = text.partition('-')
+    ngram_range = (int(minimum), int(maximum or minimum))
+    if not 0 < ngram_range[0] <= ngram_range[1]:
+        raise ValueError('Invalid n-gram range: {}'.format(text))
+    return ngram_range
+
+
+def widest_range(ngram_ranges):
+    """Return the n-gram range that contains all given ranges"""
+    return min(minimum for minimum, _ in ngram_ranges), max(maximum for _, maximum in ngram_ranges)
+
+
+def range_slice(columns, ngram_range, widest, n_features):
+    """
+    Return the (start, stop) positions of the columns of an n-gram range, in a matrix that only kept
+    the given (sorted) columns of the matrix of the widest range
+    """
+    start = (ngram_range[0] - widest[0]) * n_features
+    stop = (ngram_range[1] - widest[0] + 1) * n_features
+    return numpy.searchsorted(columns, start), numpy.searchsorted(columns, stop)
+
+
+class FoldStatistics:
+    """The document frequencies of the training part of every fold of a dataset"""
+
+    def __init__(self, x, splits):
+        total = numpy.bincount(x.indices, minlength=x.shape[1])
+        # The frequencies of the training part are those of all documents minus those of the test part
+        self.document_frequencies = [total - numpy.bincount(x[test_index].indices, minlength=x.shape[1])
+                                     for _, test_index in splits]
+        self.splits = splits
+
+
+def fit_configuration(x, y, train_index, test_index, document_frequencies, start, stop, c):
+    """
+    Fit the classifier of a configuration on the training part of a fold, with the columns between
+    start and stop, and classify the test part. Returns the predicted labels.
+    This is the same as fitting the pipeline of classify_sk on the sliced matrix.
+    """
+    from sklearn.svm import LinearSVC
+    import streaming
+    x = x[:, start:stop]
+    document_frequencies = document_frequencies[start:stop]
+    x_train, x_test = x[train_index], x[test_index]
+    n = len(train_index)
+    x_train = streaming.tfidf(x_train, document_frequencies[x_train.indices], n)
+    x_test = streaming.tfidf(x_test, document_frequencies[x_test.indices], n)
+    classifier = LinearSVC(C=c, class_weight='balanced', random_state=0)
+    classifier.fit(x_train, y[train_index])
+    return classifier.predict(x_test)
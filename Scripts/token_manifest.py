@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+# This module stores the number of tokens of every speech that split_data writes, in a manifest
+# next to the speeches (tokens.tsv, with a "language<TAB>file<TAB>tokens" line per speech).
+# The tokens are counted while the speeches are written, so select_files can select the speeches
+# by their length without reading and tokenizing them again.
+
+import os
+
+MANIFEST = 'tokens.tsv'
+
+
+def count_tokens(text):
+    """Return the number of tokens in a text, in the same way select_files has always counted them"""
+    from nltk.tokenize import wordpunct_tokenize
+    return len(wordpunct_tokenize(text))
+
+
+def write(directory, entries):
+    """Write the manifest of a directory. entries are (language, file, tokens) tuples, with file relative to it."""
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as file_handle:
+        for language, filename, tokens in sorted(entries):
+            file_handle.write('{}\t{}\t{}\n'.format(language, filename, tokens))
+    # The manifest is replaced at once, so it is never incomplete
+    os.replace(path + '.tmp', path)
+
+
+def read(directory):
+    """Return the (language, file, tokens) tuples of the manifest of a directory, or None if there is none"""
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    entries = []
+    with open(path, 'r') as file_handle:
+        for line in file_handle:
+            language, filename, tokens = line.rstrip('\n').split('\t')
+            entries.append((language, filename, int(tokens)))
+    return entries